@@ -1,3 +1,4 @@
+import asyncio
 from dataclasses import dataclass, field
 from typing import TypedDict, Union, Literal, Generic, TypeVar
 
@@ -77,6 +78,9 @@ class BaseKVStorage(Generic[T], StorageNameSpace):
     async def upsert(self, data: dict[str, T]):
         raise NotImplementedError
 
+    async def delete(self, ids: list[str]):
+        raise NotImplementedError
+
     async def drop(self):
         raise NotImplementedError
 
@@ -108,6 +112,24 @@ class BaseGraphStorage(StorageNameSpace):
     ) -> Union[list[tuple[str, str]], None]:
         raise NotImplementedError
 
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        """Batch `get_node`, backends should override it with a native batch read"""
+        return await asyncio.gather(*[self.get_node(n) for n in node_ids])
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        return await asyncio.gather(*[self.node_degree(n) for n in node_ids])
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        return await asyncio.gather(*[self.get_edge(s, t) for s, t in edges])
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        return await asyncio.gather(*[self.edge_degree(s, t) for s, t in edges])
+
+    async def get_nodes_edges(
+        self, node_ids: list[str]
+    ) -> list[Union[list[tuple[str, str]], None]]:
+        return await asyncio.gather(*[self.get_node_edges(n) for n in node_ids])
+
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
         raise NotImplementedError
 
@@ -116,6 +138,15 @@ class BaseGraphStorage(StorageNameSpace):
     ):
         raise NotImplementedError
 
+    async def upsert_nodes(self, nodes: list[tuple[str, dict[str, str]]]):
+        """Bulk `upsert_node`, backends should override it with a native bulk write"""
+        for node_id, node_data in nodes:
+            await self.upsert_node(node_id, node_data)
+
+    async def upsert_edges(self, edges: list[tuple[str, str, dict[str, str]]]):
+        for source_node_id, target_node_id, edge_data in edges:
+            await self.upsert_edge(source_node_id, target_node_id, edge_data)
+
     async def clustering(self, algorithm: str):
         raise NotImplementedError
 
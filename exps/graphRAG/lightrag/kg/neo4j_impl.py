@@ -1,5 +1,8 @@
 import asyncio
 import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from typing import Any, Union, Tuple, List, Dict
 import inspect
@@ -10,6 +13,8 @@ from neo4j import (
     exceptions as neo4jExceptions,
     AsyncDriver,
     AsyncManagedTransaction,
+    READ_ACCESS,
+    WRITE_ACCESS,
 )
 
 
@@ -34,8 +39,22 @@ class Neo4JStorage(BaseGraphStorage):
         URI = os.environ["NEO4J_URI"]
         USERNAME = os.environ["NEO4J_USERNAME"]
         PASSWORD = os.environ["NEO4J_PASSWORD"]
+        graph_params = global_config.get("graph_storage_cls_kwargs", {})
+        self._batch_size = graph_params.get("neo4j_batch_size", 500)
+        self._max_pool_size = graph_params.get("neo4j_max_connection_pool_size", 100)
         self._driver: AsyncDriver = AsyncGraphDatabase.driver(
-            URI, auth=(USERNAME, PASSWORD)
+            URI,
+            auth=(USERNAME, PASSWORD),
+            max_connection_pool_size=self._max_pool_size,
+            connection_acquisition_timeout=graph_params.get(
+                "neo4j_connection_acquisition_timeout", 60.0
+            ),
+            fetch_size=graph_params.get("neo4j_fetch_size", 1000),
+        )
+        self._sessions_in_use = 0
+        self._max_sessions_in_use = 0
+        self._query_stats = defaultdict(
+            lambda: {"count": 0, "total_time": 0.0, "max_time": 0.0}
         )
         return None
 
@@ -56,10 +75,54 @@ class Neo4JStorage(BaseGraphStorage):
     async def index_done_callback(self):
         print("KG successfully indexed.")
 
+    @asynccontextmanager
+    async def _session(self, op: str, read: bool = True):
+        """Open a pooled session routed by access mode and time its use under `op`.
+
+        Sessions are cheap views over the driver's connection pool and are not
+        safe to share between concurrent coroutines, so every call opens its
+        own; read-only calls are routed with READ access so a cluster can
+        serve them from followers.
+        """
+        self._sessions_in_use += 1
+        self._max_sessions_in_use = max(
+            self._max_sessions_in_use, self._sessions_in_use
+        )
+        start = time.perf_counter()
+        try:
+            async with self._driver.session(
+                default_access_mode=READ_ACCESS if read else WRITE_ACCESS
+            ) as session:
+                yield session
+        finally:
+            elapsed = time.perf_counter() - start
+            self._sessions_in_use -= 1
+            stats = self._query_stats[op]
+            stats["count"] += 1
+            stats["total_time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+
+    def stats(self) -> dict:
+        """Session pool usage and per-operation query time"""
+        return {
+            "pool": {
+                "max_size": self._max_pool_size,
+                "in_use": self._sessions_in_use,
+                "max_in_use": self._max_sessions_in_use,
+            },
+            "queries": {
+                op: {
+                    **stats,
+                    "avg_time": stats["total_time"] / stats["count"],
+                }
+                for op, stats in self._query_stats.items()
+            },
+        }
+
     async def has_node(self, node_id: str) -> bool:
         entity_name_label = node_id.strip('"')
 
-        async with self._driver.session() as session:
+        async with self._session("has_node") as session:
             query = (
                 f"MATCH (n:`{entity_name_label}`) RETURN count(n) > 0 AS node_exists"
             )
@@ -74,7 +137,7 @@ class Neo4JStorage(BaseGraphStorage):
         entity_name_label_source = source_node_id.strip('"')
         entity_name_label_target = target_node_id.strip('"')
 
-        async with self._driver.session() as session:
+        async with self._session("has_edge") as session:
             query = (
                 f"MATCH (a:`{entity_name_label_source}`)-[r]-(b:`{entity_name_label_target}`) "
                 "RETURN COUNT(r) > 0 AS edgeExists"
@@ -90,7 +153,7 @@ class Neo4JStorage(BaseGraphStorage):
             self._driver.close()
 
     async def get_node(self, node_id: str) -> Union[dict, None]:
-        async with self._driver.session() as session:
+        async with self._session("get_node") as session:
             entity_name_label = node_id.strip('"')
             query = f"MATCH (n:`{entity_name_label}`) RETURN n"
             result = await session.run(query)
@@ -107,7 +170,7 @@ class Neo4JStorage(BaseGraphStorage):
     async def node_degree(self, node_id: str) -> int:
         entity_name_label = node_id.strip('"')
 
-        async with self._driver.session() as session:
+        async with self._session("node_degree") as session:
             query = f"""
                 MATCH (n:`{entity_name_label}`)
                 RETURN COUNT{{ (n)--() }} AS totalEdgeCount
@@ -154,7 +217,7 @@ class Neo4JStorage(BaseGraphStorage):
         Returns:
             list: List of all relationships/edges found
         """
-        async with self._driver.session() as session:
+        async with self._session("get_edge") as session:
             query = f"""
             MATCH (start:`{entity_name_label_source}`)-[r]->(end:`{entity_name_label_target}`)
             RETURN properties(r) as edge_properties
@@ -182,30 +245,110 @@ class Neo4JStorage(BaseGraphStorage):
         Retrieves all edges (relationships) for a particular node identified by its label.
         :return: List of dictionaries containing edge information
         """
-        query = f"""MATCH (n:`{node_label}`)
-                OPTIONAL MATCH (n)-[r]-(connected)
-                RETURN n, r, connected"""
-        async with self._driver.session() as session:
+        query = f"""MATCH (n:`{node_label}`)-[]-(connected)
+                RETURN head(labels(n)) AS source_label,
+                       head(labels(connected)) AS target_label"""
+        async with self._session("get_node_edges") as session:
             results = await session.run(query)
             edges = []
             async for record in results:
-                source_node = record["n"]
-                connected_node = record["connected"]
-
-                source_label = (
-                    list(source_node.labels)[0] if source_node.labels else None
-                )
-                target_label = (
-                    list(connected_node.labels)[0]
-                    if connected_node and connected_node.labels
-                    else None
-                )
+                source_label = record["source_label"]
+                target_label = record["target_label"]
 
                 if source_label and target_label:
                     edges.append((source_label, target_label))
 
             return edges
 
+    async def _run_label_union(self, op: str, branches: List[str]) -> list:
+        """Run one query branch per label, `neo4j_batch_size` branches per query.
+
+        Entities are addressed by label, which cannot be parameterized, so the
+        batch reads below UNION ALL their lookups instead of issuing one query
+        per id; chunking keeps the query text and plan cache bounded. Each
+        branch returns an `idx` column that maps its rows back to the caller's
+        position.
+        """
+        records = []
+        if not branches:
+            return records
+        async with self._session(op) as session:
+            for start in range(0, len(branches), self._batch_size):
+                query = "\nUNION ALL\n".join(branches[start : start + self._batch_size])
+                result = await session.run(query)
+                records.extend([record async for record in result])
+        logger.debug(
+            f"{inspect.currentframe().f_code.co_name}:branches:{len(branches)}:result:{len(records)}"
+        )
+        return records
+
+    async def get_nodes(self, node_ids: List[str]) -> List[Union[dict, None]]:
+        labels = [node_id.strip('"') for node_id in node_ids]
+        records = await self._run_label_union(
+            "get_nodes",
+            [
+                f"MATCH (n:`{label}`) RETURN {i} AS idx, n LIMIT 1"
+                for i, label in enumerate(labels)
+            ],
+        )
+        nodes = [None] * len(node_ids)
+        for record in records:
+            nodes[record["idx"]] = dict(record["n"])
+        return nodes
+
+    async def node_degrees(self, node_ids: List[str]) -> List[int]:
+        labels = [node_id.strip('"') for node_id in node_ids]
+        records = await self._run_label_union(
+            "node_degrees",
+            [
+                f"MATCH (n:`{label}`) RETURN {i} AS idx, COUNT {{ (n)--() }} AS degree"
+                for i, label in enumerate(labels)
+            ],
+        )
+        degrees = [0] * len(node_ids)
+        for record in records:
+            degrees[record["idx"]] += record["degree"]
+        return degrees
+
+    async def get_edges(self, edges: List[Tuple[str, str]]) -> List[Union[dict, None]]:
+        labels = [(src.strip('"'), tgt.strip('"')) for src, tgt in edges]
+        records = await self._run_label_union(
+            "get_edges",
+            [
+                f"MATCH (:`{src}`)-[r]->(:`{tgt}`) "
+                f"RETURN {i} AS idx, properties(r) AS edge_properties LIMIT 1"
+                for i, (src, tgt) in enumerate(labels)
+            ],
+        )
+        results = [None] * len(edges)
+        for record in records:
+            results[record["idx"]] = dict(record["edge_properties"])
+        return results
+
+    async def edge_degrees(self, edges: List[Tuple[str, str]]) -> List[int]:
+        node_ids = list({node_id for edge in edges for node_id in edge})
+        degrees = dict(zip(node_ids, await self.node_degrees(node_ids)))
+        return [degrees[src] + degrees[tgt] for src, tgt in edges]
+
+    async def get_nodes_edges(self, node_ids: List[str]) -> List[List[Tuple[str, str]]]:
+        labels = [node_id.strip('"') for node_id in node_ids]
+        records = await self._run_label_union(
+            "get_nodes_edges",
+            [
+                f"MATCH (n:`{label}`)-[]-(connected) "
+                f"RETURN {i} AS idx, labels(n) AS source_labels, "
+                "labels(connected) AS target_labels"
+                for i, label in enumerate(labels)
+            ],
+        )
+        results = [[] for _ in node_ids]
+        for record in records:
+            if record["source_labels"] and record["target_labels"]:
+                results[record["idx"]].append(
+                    (record["source_labels"][0], record["target_labels"][0])
+                )
+        return results
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -239,7 +382,7 @@ class Neo4JStorage(BaseGraphStorage):
             )
 
         try:
-            async with self._driver.session() as session:
+            async with self._session("upsert_node", read=False) as session:
                 await session.execute_write(_do_upsert)
         except Exception as e:
             logger.error(f"Error during upsert: {str(e)}")
@@ -286,11 +429,254 @@ class Neo4JStorage(BaseGraphStorage):
             )
 
         try:
-            async with self._driver.session() as session:
+            async with self._session("upsert_edge", read=False) as session:
                 await session.execute_write(_do_upsert_edge)
         except Exception as e:
             logger.error(f"Error during edge upsert: {str(e)}")
             raise
 
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=4, max=10),
+        retry=retry_if_exception_type(
+            (
+                neo4jExceptions.ServiceUnavailable,
+                neo4jExceptions.TransientError,
+                neo4jExceptions.WriteServiceUnavailable,
+            )
+        ),
+    )
+    async def _write_batch(self, query: str, rows: List[Dict[str, Any]]):
+        """Run one bulk write in its own transaction, retried as a whole"""
+
+        async def _do_write(tx: AsyncManagedTransaction):
+            result = await tx.run(query, rows=rows)
+            await result.consume()
+
+        async with self._session("write_batch", read=False) as session:
+            await session.execute_write(_do_write)
+        logger.debug(f"Wrote batch of {len(rows)} rows")
+
+    async def upsert_nodes(self, nodes: List[Tuple[str, Dict[str, Any]]]):
+        """
+        Upsert many nodes with one transaction per `neo4j_batch_size` nodes.
+
+        Entity names are labels and cannot be bound as parameters, so each
+        node becomes a unit `CALL {}` subquery; the properties still travel as
+        the `$rows` parameter list.
+        """
+        for start in range(0, len(nodes), self._batch_size):
+            batch = nodes[start : start + self._batch_size]
+            labels = [node_id.strip('"') for node_id, _ in batch]
+            query = "\n".join(
+                f"CALL {{ MERGE (n:`{label}`) SET n += $rows[{i}] }}"
+                for i, label in enumerate(labels)
+            )
+            try:
+                await self._write_batch(query, [node_data for _, node_data in batch])
+            except Exception as e:
+                logger.error(f"Error during bulk node upsert: {str(e)}")
+                raise
+
+    async def upsert_edges(self, edges: List[Tuple[str, str, Dict[str, Any]]]):
+        """
+        Upsert many edges with one transaction per `neo4j_batch_size` edges.
+
+        Unit subqueries keep an edge whose endpoint is missing from stopping
+        the rest of the batch, matching `upsert_edge` which silently skips it.
+        """
+        for start in range(0, len(edges), self._batch_size):
+            batch = edges[start : start + self._batch_size]
+            labels = [(src.strip('"'), tgt.strip('"')) for src, tgt, _ in batch]
+            query = "\n".join(
+                f"CALL {{ MATCH (source:`{src}`) MATCH (target:`{tgt}`) "
+                f"MERGE (source)-[r:DIRECTED]->(target) SET r += $rows[{i}] }}"
+                for i, (src, tgt) in enumerate(labels)
+            )
+            try:
+                await self._write_batch(query, [edge_data for _, _, edge_data in batch])
+            except Exception as e:
+                logger.error(f"Error during bulk edge upsert: {str(e)}")
+                raise
+
     async def _node2vec_embed(self):
         print("Implemented but never called.")
+
+
+@dataclass
+class Neo4JEntityStorage(Neo4JStorage):
+    """
+    Neo4j graph storage that keys every entity by an indexed `id` property.
+
+    `Neo4JStorage` turns each entity name into its own label, so no index can
+    serve its lookups and every query text is unique. Here all entities are
+    `:Entity` nodes with a uniqueness constraint on `id`. Every lookup is then
+    an index seek, and every query is fully parameterized so the driver and
+    server can reuse their plans. Select it with kg="Neo4JEntityStorage". It
+    does not read graphs written in label mode.
+    """
+
+    def __init__(self, namespace, global_config):
+        super().__init__(namespace=namespace, global_config=global_config)
+        self._constraints_ready = False
+
+    async def _ensure_constraints(self):
+        if self._constraints_ready:
+            return
+        async with self._driver_lock:
+            if self._constraints_ready:
+                return
+            async with self._session("ensure_constraints", read=False) as session:
+                result = await session.run(
+                    "CREATE CONSTRAINT entity_id IF NOT EXISTS "
+                    "FOR (n:Entity) REQUIRE n.id IS UNIQUE"
+                )
+                await result.consume()
+            self._constraints_ready = True
+
+    async def _read(self, op: str, query: str, **parameters) -> list:
+        async with self._session(op) as session:
+            result = await session.run(query, **parameters)
+            records = [record async for record in result]
+        logger.debug(
+            f"{inspect.currentframe().f_code.co_name}:query:{query}:result:{len(records)}"
+        )
+        return records
+
+    async def _write_batch(self, query: str, rows: List[Dict[str, Any]]):
+        await self._ensure_constraints()
+        await super()._write_batch(query, rows)
+
+    @staticmethod
+    def _node_properties(node) -> dict:
+        node_dict = dict(node)
+        node_dict.pop("id", None)
+        return node_dict
+
+    async def has_node(self, node_id: str) -> bool:
+        records = await self._read(
+            "has_node",
+            "MATCH (n:Entity {id: $id}) RETURN count(n) > 0 AS node_exists",
+            id=node_id,
+        )
+        return records[0]["node_exists"]
+
+    async def has_edge(self, source_node_id: str, target_node_id: str) -> bool:
+        records = await self._read(
+            "has_edge",
+            "MATCH (:Entity {id: $src})-[r]-(:Entity {id: $tgt}) "
+            "RETURN COUNT(r) > 0 AS edgeExists",
+            src=source_node_id,
+            tgt=target_node_id,
+        )
+        return records[0]["edgeExists"]
+
+    async def get_node(self, node_id: str) -> Union[dict, None]:
+        return (await self.get_nodes([node_id]))[0]
+
+    async def node_degree(self, node_id: str) -> int:
+        return (await self.node_degrees([node_id]))[0]
+
+    async def get_edge(
+        self, source_node_id: str, target_node_id: str
+    ) -> Union[dict, None]:
+        return (await self.get_edges([(source_node_id, target_node_id)]))[0]
+
+    async def get_node_edges(self, source_node_id: str) -> List[Tuple[str, str]]:
+        return (await self.get_nodes_edges([source_node_id]))[0]
+
+    async def get_nodes(self, node_ids: List[str]) -> List[Union[dict, None]]:
+        records = await self._read(
+            "get_nodes",
+            "UNWIND $ids AS id MATCH (n:Entity {id: id}) RETURN id, n",
+            ids=node_ids,
+        )
+        found = {record["id"]: self._node_properties(record["n"]) for record in records}
+        return [found.get(node_id) for node_id in node_ids]
+
+    async def node_degrees(self, node_ids: List[str]) -> List[int]:
+        records = await self._read(
+            "node_degrees",
+            "UNWIND $ids AS id MATCH (n:Entity {id: id}) "
+            "RETURN id, COUNT { (n)--() } AS degree",
+            ids=node_ids,
+        )
+        found = {record["id"]: record["degree"] for record in records}
+        return [found.get(node_id, 0) for node_id in node_ids]
+
+    async def get_edges(self, edges: List[Tuple[str, str]]) -> List[Union[dict, None]]:
+        records = await self._read(
+            "get_edges",
+            "UNWIND $rows AS row "
+            "MATCH (:Entity {id: row.src})-[r]->(:Entity {id: row.tgt}) "
+            "RETURN row.idx AS idx, head(collect(properties(r))) AS edge_properties",
+            rows=[
+                {"idx": i, "src": src, "tgt": tgt} for i, (src, tgt) in enumerate(edges)
+            ],
+        )
+        results = [None] * len(edges)
+        for record in records:
+            results[record["idx"]] = dict(record["edge_properties"])
+        return results
+
+    async def get_nodes_edges(self, node_ids: List[str]) -> List[List[Tuple[str, str]]]:
+        records = await self._read(
+            "get_nodes_edges",
+            "UNWIND $rows AS row "
+            "MATCH (n:Entity {id: row.id})--(connected:Entity) "
+            "RETURN row.idx AS idx, connected.id AS target_id",
+            rows=[{"idx": i, "id": node_id} for i, node_id in enumerate(node_ids)],
+        )
+        results = [[] for _ in node_ids]
+        for record in records:
+            results[record["idx"]].append(
+                (node_ids[record["idx"]], record["target_id"])
+            )
+        return results
+
+    async def upsert_node(self, node_id: str, node_data: Dict[str, Any]):
+        await self.upsert_nodes([(node_id, node_data)])
+
+    async def upsert_edge(
+        self, source_node_id: str, target_node_id: str, edge_data: Dict[str, Any]
+    ):
+        await self.upsert_edges([(source_node_id, target_node_id, edge_data)])
+
+    async def upsert_nodes(self, nodes: List[Tuple[str, Dict[str, Any]]]):
+        query = (
+            "UNWIND $rows AS row MERGE (n:Entity {id: row.id}) SET n += row.properties"
+        )
+        for start in range(0, len(nodes), self._batch_size):
+            batch = nodes[start : start + self._batch_size]
+            try:
+                await self._write_batch(
+                    query,
+                    [
+                        {"id": node_id, "properties": node_data}
+                        for node_id, node_data in batch
+                    ],
+                )
+            except Exception as e:
+                logger.error(f"Error during bulk node upsert: {str(e)}")
+                raise
+
+    async def upsert_edges(self, edges: List[Tuple[str, str, Dict[str, Any]]]):
+        query = (
+            "UNWIND $rows AS row "
+            "MATCH (source:Entity {id: row.src}) "
+            "MATCH (target:Entity {id: row.tgt}) "
+            "MERGE (source)-[r:DIRECTED]->(target) SET r += row.properties"
+        )
+        for start in range(0, len(edges), self._batch_size):
+            batch = edges[start : start + self._batch_size]
+            try:
+                await self._write_batch(
+                    query,
+                    [
+                        {"src": src, "tgt": tgt, "properties": edge_data}
+                        for src, tgt, edge_data in batch
+                    ],
+                )
+            except Exception as e:
+                logger.error(f"Error during bulk edge upsert: {str(e)}")
+                raise
@@ -1,5 +1,7 @@
 import asyncio
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import asdict, dataclass, field
 from datetime import datetime
 from functools import partial
@@ -8,10 +10,12 @@ from typing import Type, cast
 from .llm import (
     gpt_4o_mini_complete,
     openai_embedding,
+    llm_client_registry,
 )
 from .operate import (
-    chunking_by_token_size,
-    extract_entities,
+    iter_chunks_by_token_size,
+    extract_chunk_entities,
+    merge_chunk_entities,
     local_query,
     global_query,
     hybrid_query,
@@ -22,9 +26,10 @@ from .storage import (
     JsonKVStorage,
     NanoVectorDBStorage,
     NetworkXStorage,
+    CSRGraphStorage,
 )
 
-from .kg.neo4j_impl import Neo4JStorage
+from .kg.neo4j_impl import Neo4JStorage, Neo4JEntityStorage
 # future KG integrations
 
 # from .kg.ArangoDB_impl import (
@@ -36,6 +41,9 @@ from .utils import (
     EmbeddingFunc,
     compute_mdhash_id,
     limit_async_func_call,
+    batch_embedding_func_calls,
+    SemanticLLMCache,
+    KeywordsCache,
     convert_response_to_json,
     logger,
     set_logger,
@@ -77,10 +85,23 @@ class LightRAG:
     chunk_token_size: int = 1200
     chunk_overlap_token_size: int = 100
     tiktoken_model_name: str = "gpt-4o-mini"
+    # worker processes that chunk documents, 0 to chunk in a thread instead
+    chunking_max_workers: int = 0
+    # start method of those processes ("spawn", "forkserver", ...), None for
+    # the platform default
+    chunking_mp_context: str = None
+
+    # insert pipeline
+    insert_batch_size: int = 10
+    insert_queue_size: int = 2
 
     # entity extraction
     entity_extract_max_gleaning: int = 1
     entity_summary_to_max_tokens: int = 500
+    enable_extraction_checkpoint: bool = True
+    # checkpoints are flushed every this many chunks or seconds, whichever is first
+    extraction_checkpoint_flush_chunks: int = 32
+    extraction_checkpoint_flush_interval: float = 10.0
 
     # node embedding
     node_embedding_algorithm: str = "node2vec"
@@ -98,6 +119,7 @@ class LightRAG:
     # embedding_func: EmbeddingFunc = field(default_factory=lambda:hf_embedding)
     embedding_func: EmbeddingFunc = field(default_factory=lambda: openai_embedding)
     embedding_batch_num: int = 32
+    embedding_batch_wait_time: float = 0.002
     embedding_func_max_async: int = 16
 
     # LLM
@@ -106,12 +128,26 @@ class LightRAG:
     llm_model_max_token_size: int = 32768
     llm_model_max_async: int = 16
     llm_model_kwargs: dict = field(default_factory=dict)
+    # pool limits of the shared LLM/embedding API clients, see LLMClientRegistry
+    llm_client_pool_kwargs: dict = field(default_factory=dict)
 
     # storage
     key_string_value_json_storage_cls: Type[BaseKVStorage] = JsonKVStorage
+    kv_storage_cls_kwargs: dict = field(default_factory=dict)
     vector_db_storage_cls: Type[BaseVectorStorage] = NanoVectorDBStorage
     vector_db_storage_cls_kwargs: dict = field(default_factory=dict)
+    graph_storage_cls_kwargs: dict = field(default_factory=dict)
     enable_llm_cache: bool = True
+    # storage of llm_response_cache, defaults to key_string_value_json_storage_cls;
+    # BoundedLLMCacheStorage bounds it by size and age
+    llm_response_cache_storage_cls: Type[BaseKVStorage] = None
+    llm_response_cache_storage_cls_kwargs: dict = field(default_factory=dict)
+    # answer paraphrased queries from earlier ones, see SemanticLLMCache
+    enable_semantic_llm_cache: bool = False
+    semantic_llm_cache_kwargs: dict = field(default_factory=dict)
+    # share each query's extracted keywords across query modes, see KeywordsCache
+    enable_keywords_cache: bool = True
+    keywords_cache_kwargs: dict = field(default_factory=dict)
 
     # extension
     addon_params: dict = field(default_factory=dict)
@@ -127,6 +163,10 @@ class LightRAG:
         _print_config = ",\n  ".join([f"{k} = {v}" for k, v in asdict(self).items()])
         logger.debug(f"LightRAG init with param:\n  {_print_config}\n")
 
+        if self.llm_client_pool_kwargs:
+            llm_client_registry.configure(**self.llm_client_pool_kwargs)
+        self._chunking_executor: ProcessPoolExecutor = None
+
         # @TODO: should move all storage setup here to leverage initial start params attached to self.
         self.graph_storage_cls: Type[BaseGraphStorage] = self._get_storage_class()[
             self.kg
@@ -144,13 +184,24 @@ class LightRAG:
             namespace="text_chunks", global_config=asdict(self)
         )
 
+        llm_response_cache_storage_cls = (
+            self.llm_response_cache_storage_cls
+            or self.key_string_value_json_storage_cls
+        )
         self.llm_response_cache = (
-            self.key_string_value_json_storage_cls(
+            llm_response_cache_storage_cls(
                 namespace="llm_response_cache", global_config=asdict(self)
             )
             if self.enable_llm_cache
             else None
         )
+        self.extraction_checkpoints = (
+            self.key_string_value_json_storage_cls(
+                namespace="extraction_checkpoints", global_config=asdict(self)
+            )
+            if self.enable_extraction_checkpoint
+            else None
+        )
         self.chunk_entity_relation_graph = self.graph_storage_cls(
             namespace="chunk_entity_relation", global_config=asdict(self)
         )
@@ -158,6 +209,10 @@ class LightRAG:
         self.embedding_func = limit_async_func_call(self.embedding_func_max_async)(
             self.embedding_func
         )
+        if self.embedding_batch_wait_time > 0:
+            self.embedding_func = batch_embedding_func_calls(
+                self.embedding_batch_num, self.embedding_batch_wait_time
+            )(self.embedding_func)
 
         self.entities_vdb = self.vector_db_storage_cls(
             namespace="entities",
@@ -184,11 +239,24 @@ class LightRAG:
                 **self.llm_model_kwargs,
             )
         )
+        self.semantic_llm_cache = None
+        if self.enable_semantic_llm_cache:
+            self.semantic_llm_cache = SemanticLLMCache(
+                self.embedding_func, **self.semantic_llm_cache_kwargs
+            )
+            self.llm_model_func = self.semantic_llm_cache.wrap(self.llm_model_func)
+        self.keywords_cache = (
+            KeywordsCache(**self.keywords_cache_kwargs)
+            if self.enable_keywords_cache
+            else None
+        )
 
     def _get_storage_class(self) -> Type[BaseGraphStorage]:
         return {
             "Neo4JStorage": Neo4JStorage,
+            "Neo4JEntityStorage": Neo4JEntityStorage,
             "NetworkXStorage": NetworkXStorage,
+            "CSRGraphStorage": CSRGraphStorage,
             # "ArangoDBStorage": ArangoDBStorage
         }
 
@@ -197,36 +265,103 @@ class LightRAG:
         return loop.run_until_complete(self.ainsert(string_or_strings))
 
     async def ainsert(self, string_or_strings):
+        """Insert documents through a staged, bounded pipeline.
+
+        `string_or_strings` may be a string, an iterable of strings or an async
+        iterator of strings. Documents are grouped into batches of
+        `insert_batch_size` and flow through chunk -> embed -> extract ->
+        merge/persist stages joined by queues of `insert_queue_size`, so only a
+        few batches are held in memory and each batch is committed on its own.
+        """
+        queues = [asyncio.Queue(maxsize=self.insert_queue_size) for _ in range(3)]
+        stages = [
+            self._chunk_stage(string_or_strings, queues[0]),
+            self._embed_stage(queues[0], queues[1]),
+            self._extract_stage(queues[1], queues[2]),
+            self._commit_stage(queues[2]),
+        ]
+        tasks = [asyncio.ensure_future(stage) for stage in stages]
         try:
-            if isinstance(string_or_strings, str):
-                string_or_strings = [string_or_strings]
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # keep whatever the finished LLM calls left in the cache
+            await self._insert_done()
+            raise
+
+    async def _iter_doc_batches(self, string_or_strings):
+        if isinstance(string_or_strings, str):
+            string_or_strings = [string_or_strings]
+        batch = []
+        if hasattr(string_or_strings, "__aiter__"):
+            async for doc in string_or_strings:
+                batch.append(doc)
+                if len(batch) >= self.insert_batch_size:
+                    yield batch
+                    batch = []
+        else:
+            for doc in string_or_strings:
+                batch.append(doc)
+                if len(batch) >= self.insert_batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _get_chunking_executor(self) -> ProcessPoolExecutor:
+        if self.chunking_max_workers <= 0:
+            return None
+        if self._chunking_executor is None:
+            self._chunking_executor = ProcessPoolExecutor(
+                max_workers=self.chunking_max_workers,
+                mp_context=multiprocessing.get_context(self.chunking_mp_context),
+            )
+        return self._chunking_executor
 
+    async def _chunk_stage(self, string_or_strings, out_queue: asyncio.Queue):
+        seen_doc_keys = set()
+        seen_chunk_keys = set()
+        total_docs = 0
+        async for batch in self._iter_doc_batches(string_or_strings):
             new_docs = {
                 compute_mdhash_id(c.strip(), prefix="doc-"): {"content": c.strip()}
-                for c in string_or_strings
+                for c in batch
             }
+            new_docs = {k: v for k, v in new_docs.items() if k not in seen_doc_keys}
             _add_doc_keys = await self.full_docs.filter_keys(list(new_docs.keys()))
             new_docs = {k: v for k, v in new_docs.items() if k in _add_doc_keys}
             if not len(new_docs):
-                logger.warning("All docs are already in the storage")
-                return
+                continue
+            seen_doc_keys.update(new_docs.keys())
+            total_docs += len(new_docs)
             logger.info(f"[New Docs] inserting {len(new_docs)} docs")
 
             inserting_chunks = {}
-            for doc_key, doc in new_docs.items():
-                chunks = {
-                    compute_mdhash_id(dp["content"], prefix="chunk-"): {
-                        **dp,
-                        "full_doc_id": doc_key,
+            doc_chunks = iter_chunks_by_token_size(
+                [doc["content"] for doc in new_docs.values()],
+                overlap_token_size=self.chunk_overlap_token_size,
+                max_token_size=self.chunk_token_size,
+                tiktoken_model=self.tiktoken_model_name,
+                executor=self._get_chunking_executor(),
+                num_shards=max(1, self.chunking_max_workers),
+            )
+            doc_keys = iter(new_docs)
+            async for chunks in doc_chunks:
+                doc_key = next(doc_keys)
+                inserting_chunks.update(
+                    {
+                        compute_mdhash_id(dp["content"], prefix="chunk-"): {
+                            **dp,
+                            "full_doc_id": doc_key,
+                        }
+                        for dp in chunks
                     }
-                    for dp in chunking_by_token_size(
-                        doc["content"],
-                        overlap_token_size=self.chunk_overlap_token_size,
-                        max_token_size=self.chunk_token_size,
-                        tiktoken_model=self.tiktoken_model_name,
-                    )
-                }
-                inserting_chunks.update(chunks)
+                )
+            inserting_chunks = {
+                k: v for k, v in inserting_chunks.items() if k not in seen_chunk_keys
+            }
             _add_chunk_keys = await self.text_chunks.filter_keys(
                 list(inserting_chunks.keys())
             )
@@ -235,14 +370,38 @@ class LightRAG:
             }
             if not len(inserting_chunks):
                 logger.warning("All chunks are already in the storage")
-                return
+                continue
+            seen_chunk_keys.update(inserting_chunks.keys())
             logger.info(f"[New Chunks] inserting {len(inserting_chunks)} chunks")
-
+            await out_queue.put((new_docs, inserting_chunks))
+        if not total_docs:
+            logger.warning("All docs are already in the storage")
+        await out_queue.put(None)
+
+    async def _embed_stage(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        while (item := await in_queue.get()) is not None:
+            _, inserting_chunks = item
             await self.chunks_vdb.upsert(inserting_chunks)
+            await out_queue.put(item)
+        await out_queue.put(None)
 
+    async def _extract_stage(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        while (item := await in_queue.get()) is not None:
+            new_docs, inserting_chunks = item
             logger.info("[Entity Extraction]...")
-            maybe_new_kg = await extract_entities(
+            results = await extract_chunk_entities(
                 inserting_chunks,
+                global_config=asdict(self),
+                checkpoint_kv=self.extraction_checkpoints,
+            )
+            await out_queue.put((new_docs, inserting_chunks, results))
+        await out_queue.put(None)
+
+    async def _commit_stage(self, in_queue: asyncio.Queue):
+        while (item := await in_queue.get()) is not None:
+            new_docs, inserting_chunks, results = item
+            maybe_new_kg = await merge_chunk_entities(
+                results,
                 knowledge_graph_inst=self.chunk_entity_relation_graph,
                 entity_vdb=self.entities_vdb,
                 relationships_vdb=self.relationships_vdb,
@@ -250,12 +409,16 @@ class LightRAG:
             )
             if maybe_new_kg is None:
                 logger.warning("No new entities and relationships found")
-                return
-            self.chunk_entity_relation_graph = maybe_new_kg
-
-            await self.full_docs.upsert(new_docs)
-            await self.text_chunks.upsert(inserting_chunks)
-        finally:
+            else:
+                self.chunk_entity_relation_graph = maybe_new_kg
+                await self.full_docs.upsert(new_docs)
+                await self.text_chunks.upsert(inserting_chunks)
+                if self.extraction_checkpoints is not None:
+                    # the batch is durable in text_chunks, its checkpoints are spent
+                    await self.extraction_checkpoints.delete(
+                        list(inserting_chunks.keys())
+                    )
+            # chunk vectors and LLM responses of the batch are persisted either way
             await self._insert_done()
 
     async def _insert_done(self):
@@ -264,6 +427,7 @@ class LightRAG:
             self.full_docs,
             self.text_chunks,
             self.llm_response_cache,
+            self.extraction_checkpoints,
             self.entities_vdb,
             self.relationships_vdb,
             self.chunks_vdb,
@@ -273,6 +437,9 @@ class LightRAG:
                 continue
             tasks.append(cast(StorageNameSpace, storage_inst).index_done_callback())
         await asyncio.gather(*tasks)
+        if self.semantic_llm_cache is not None:
+            # cached answers were built from the graph before this insert
+            self.semantic_llm_cache.clear()
 
     def query(self, query: str, param: QueryParam = QueryParam()):
         loop = always_get_an_event_loop()
@@ -288,6 +455,7 @@ class LightRAG:
                 self.text_chunks,
                 param,
                 asdict(self),
+                keywords_cache=self.keywords_cache,
             )
         elif param.mode == "global":
             response = await global_query(
@@ -298,6 +466,7 @@ class LightRAG:
                 self.text_chunks,
                 param,
                 asdict(self),
+                keywords_cache=self.keywords_cache,
             )
         elif param.mode == "hybrid":
             response = await hybrid_query(
@@ -308,6 +477,7 @@ class LightRAG:
                 self.text_chunks,
                 param,
                 asdict(self),
+                keywords_cache=self.keywords_cache,
             )
         elif param.mode == "naive":
             response = await naive_query(
@@ -329,3 +499,17 @@ class LightRAG:
                 continue
             tasks.append(cast(StorageNameSpace, storage_inst).index_done_callback())
         await asyncio.gather(*tasks)
+
+    def close(self):
+        loop = always_get_an_event_loop()
+        return loop.run_until_complete(self.aclose())
+
+    async def aclose(self):
+        """Release API clients, chunking workers and graph database connections"""
+        await llm_client_registry.aclose()
+        if self._chunking_executor is not None:
+            self._chunking_executor.shutdown(cancel_futures=True)
+            self._chunking_executor = None
+        close = getattr(self.chunk_entity_relation_graph, "close", None)
+        if close is not None:
+            await close()
@@ -1,9 +1,15 @@
 import os
 import copy
+import asyncio
+import importlib.util
+import inspect
 from functools import lru_cache
 import json
 import aioboto3
 import aiohttp
+from botocore.config import Config
+from botocore.exceptions import ClientError
+import httpx
 import numpy as np
 import ollama
 
@@ -16,6 +22,7 @@ from openai import (
 )
 
 import base64
+import random
 import struct
 
 from tenacity import (
@@ -27,13 +34,136 @@ from tenacity import (
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import torch
 from pydantic import BaseModel, Field
-from typing import List, Dict, Callable, Any
+from typing import List, Dict, Callable, Any, Awaitable
 from .base import BaseKVStorage
 from .utils import compute_args_hash, wrap_embedding_func_with_attrs
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 
+class LLMClientRegistry:
+    """Process-wide cache of API clients, so calls reuse their connection pools
+
+    Clients are keyed by provider, base url and api key. Async clients hold
+    connections bound to the event loop that opened them, so they are also
+    keyed by that loop, and clients of closed loops are dropped.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+    ):
+        self._clients: dict[tuple, Any] = {}
+        self.configure(max_connections, max_keepalive_connections, keepalive_expiry)
+
+    def configure(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+    ):
+        """Set pool limits for clients created from now on"""
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+
+    def httpx_kwargs(self) -> dict:
+        return dict(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            # HTTP/2 multiplexes requests over one connection, but needs h2
+            http2=importlib.util.find_spec("h2") is not None,
+        )
+
+    def get(self, key: tuple, factory: Callable[[], Any]):
+        key = key + (asyncio.get_running_loop(),)
+        for stale in [k for k in self._clients if _client_loop_closed(k)]:
+            del self._clients[stale]
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = factory()
+        return client
+
+    async def aget(self, key: tuple, factory: Callable[[], Awaitable[Any]]):
+        """`get` for clients that are opened by awaiting `factory()`"""
+        task = self.get(key, lambda: asyncio.ensure_future(factory()))
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            # do not cache a failed open, the next call tries again
+            self._clients.pop(key + (asyncio.get_running_loop(),), None)
+            raise
+
+    async def aclose(self):
+        """Close every client that can be closed from the running loop"""
+        loop = asyncio.get_running_loop()
+        clients, self._clients = self._clients, {}
+        for key, client in clients.items():
+            if key[-1] is not loop:
+                continue
+            if isinstance(client, asyncio.Future):
+                if not client.done() or client.exception() is not None:
+                    client.cancel()
+                    continue
+                client = client.result()
+            close = getattr(client, "close", None)
+            if close is None:
+                continue
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+
+
+def _client_loop_closed(key: tuple) -> bool:
+    return key[-1].is_closed()
+
+
+llm_client_registry = LLMClientRegistry()
+
+
+def _openai_client(base_url=None, api_key=None) -> AsyncOpenAI:
+    api_key = api_key or os.environ.get("OPENAI_API_KEY")
+    return llm_client_registry.get(
+        ("openai", base_url, api_key),
+        lambda: AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=httpx.AsyncClient(**llm_client_registry.httpx_kwargs()),
+        ),
+    )
+
+
+def _ollama_client(host=None, timeout=None, **kwargs) -> ollama.AsyncClient:
+    # options such as headers (a dict) or an httpx timeout are not hashable,
+    # so the key holds their reprs instead
+    return llm_client_registry.get(
+        ("ollama", host, None, repr(timeout), repr(sorted(kwargs.items()))),
+        lambda: ollama.AsyncClient(
+            host=host, timeout=timeout, **llm_client_registry.httpx_kwargs(), **kwargs
+        ),
+    )
+
+
+def _azure_openai_client(base_url=None, api_key=None) -> AsyncAzureOpenAI:
+    azure_endpoint = base_url or os.getenv("AZURE_OPENAI_ENDPOINT")
+    api_key = api_key or os.getenv("AZURE_OPENAI_API_KEY")
+    api_version = os.getenv("AZURE_OPENAI_API_VERSION")
+    return llm_client_registry.get(
+        ("azure_openai", azure_endpoint, api_key, api_version),
+        lambda: AsyncAzureOpenAI(
+            azure_endpoint=azure_endpoint,
+            api_key=api_key,
+            api_version=api_version,
+            http_client=httpx.AsyncClient(**llm_client_registry.httpx_kwargs()),
+        ),
+    )
+
+
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -48,12 +178,7 @@ async def openai_complete_if_cache(
     api_key=None,
     **kwargs,
 ) -> str:
-    if api_key:
-        os.environ["OPENAI_API_KEY"] = api_key
-
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
-    )
+    openai_async_client = _openai_client(base_url, api_key)
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
     messages = []
     if system_prompt:
@@ -91,16 +216,7 @@ async def azure_openai_complete_if_cache(
     api_key=None,
     **kwargs,
 ):
-    if api_key:
-        os.environ["AZURE_OPENAI_API_KEY"] = api_key
-    if base_url:
-        os.environ["AZURE_OPENAI_ENDPOINT"] = base_url
-
-    openai_async_client = AsyncAzureOpenAI(
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    )
+    openai_async_client = _azure_openai_client(base_url, api_key)
 
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
     messages = []
@@ -229,11 +345,111 @@ def initialize_hf_model(model_name):
     return hf_model, hf_tokenizer
 
 
+class HFGenerationEngine:
+    """Resident HF causal LM that generates concurrent prompts as one batch
+
+    The model is loaded once. Prompts submitted while a batch is generating
+    queue up and are padded into the next batch (up to `max_batch_size`,
+    grouped by `max_new_tokens`), so concurrent extraction calls share
+    forward passes instead of running one by one. Generation runs in a worker
+    thread and leaves the event loop free.
+    """
+
+    def __init__(
+        self, model_name: str, max_batch_size: int = 8, max_wait_time: float = 0.01
+    ):
+        self.model, self.tokenizer = initialize_hf_model(model_name)
+        # decoder-only models continue from the right edge, so pad on the left
+        self.tokenizer.padding_side = "left"
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.total_calls = 0
+        self.total_batches = 0
+        self._queue: asyncio.Queue = None
+        self._worker: asyncio.Task = None
+
+    async def generate(self, input_prompt: str, max_new_tokens: int = 512) -> str:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        future = loop.create_future()
+        self.total_calls += 1
+        await self._queue.put((input_prompt, max_new_tokens, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch_size - 1:
+                # give concurrent callers a moment to join this batch
+                await asyncio.sleep(self.max_wait_time)
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            batch = [item for item in batch if not item[2].cancelled()]
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for max_new_tokens, items in groups.items():
+                self.total_batches += 1
+                try:
+                    texts = await asyncio.to_thread(
+                        self._generate_batch, [p for p, _, _ in items], max_new_tokens
+                    )
+                except Exception as e:
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, _, future), text in zip(items, texts):
+                    if not future.done():
+                        future.set_result(text)
+
+    def _generate_batch(self, prompts: list[str], max_new_tokens: int) -> list[str]:
+        inputs = self.tokenizer(
+            prompts, return_tensors="pt", padding=True, truncation=True
+        ).to(self.model.device)
+        with torch.inference_mode():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                num_return_sequences=1,
+                early_stopping=True,
+                pad_token_id=self.tokenizer.pad_token_id,
+            )
+        prompt_length = inputs["input_ids"].shape[1]
+        return self.tokenizer.batch_decode(
+            output[:, prompt_length:], skip_special_tokens=True
+        )
+
+    def stats(self) -> dict:
+        return {
+            "total_calls": self.total_calls,
+            "total_batches": self.total_batches,
+        }
+
+
+_hf_engines: dict[str, HFGenerationEngine] = {}
+
+
+def get_hf_engine(model_name: str, **engine_kwargs) -> HFGenerationEngine:
+    """Return the process-wide engine of `model_name`, loading it on first use"""
+    if model_name not in _hf_engines:
+        _hf_engines[model_name] = HFGenerationEngine(model_name, **engine_kwargs)
+    return _hf_engines[model_name]
+
+
 async def hf_model_if_cache(
     model, prompt, system_prompt=None, history_messages=[], **kwargs
 ) -> str:
     model_name = model
-    hf_model, hf_tokenizer = initialize_hf_model(model_name)
+    engine = get_hf_engine(
+        model_name,
+        max_batch_size=kwargs.pop("hf_max_batch_size", 8),
+        max_wait_time=kwargs.pop("hf_max_wait_time", 0.01),
+    )
+    hf_tokenizer = engine.tokenizer
+    max_new_tokens = kwargs.pop("max_tokens", 512)
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
     messages = []
     if system_prompt:
@@ -279,16 +495,7 @@ async def hf_model_if_cache(
                     + ">\n"
                 )
 
-    input_ids = hf_tokenizer(
-        input_prompt, return_tensors="pt", padding=True, truncation=True
-    ).to("cuda")
-    inputs = {k: v.to(hf_model.device) for k, v in input_ids.items()}
-    output = hf_model.generate(
-        **input_ids, max_new_tokens=512, num_return_sequences=1, early_stopping=True
-    )
-    response_text = hf_tokenizer.decode(
-        output[0][len(inputs["input_ids"][0]) :], skip_special_tokens=True
-    )
+    response_text = await engine.generate(input_prompt, max_new_tokens)
     if hashing_kv is not None:
         await hashing_kv.upsert({args_hash: {"return": response_text, "model": model}})
     return response_text
@@ -302,7 +509,7 @@ async def ollama_model_if_cache(
     host = kwargs.pop("host", None)
     timeout = kwargs.pop("timeout", None)
 
-    ollama_client = ollama.AsyncClient(host=host, timeout=timeout)
+    ollama_client = _ollama_client(host, timeout)
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
@@ -541,12 +748,7 @@ async def openai_embedding(
     base_url: str = None,
     api_key: str = None,
 ) -> np.ndarray:
-    if api_key:
-        os.environ["OPENAI_API_KEY"] = api_key
-
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
-    )
+    openai_async_client = _openai_client(base_url, api_key)
     response = await openai_async_client.embeddings.create(
         model=model, input=texts, encoding_format="float"
     )
@@ -565,16 +767,7 @@ async def azure_openai_embedding(
     base_url: str = None,
     api_key: str = None,
 ) -> np.ndarray:
-    if api_key:
-        os.environ["AZURE_OPENAI_API_KEY"] = api_key
-    if base_url:
-        os.environ["AZURE_OPENAI_ENDPOINT"] = base_url
-
-    openai_async_client = AsyncAzureOpenAI(
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    )
+    openai_async_client = _azure_openai_client(base_url, api_key)
 
     response = await openai_async_client.embeddings.create(
         model=model, input=texts, encoding_format="float"
@@ -604,12 +797,20 @@ async def siliconcloud_embedding(
     payload = {"model": model, "input": truncate_texts, "encoding_format": "base64"}
 
     base64_strings = []
-    async with aiohttp.ClientSession() as session:
-        async with session.post(base_url, headers=headers, json=payload) as response:
-            content = await response.json()
-            if "code" in content:
-                raise ValueError(content)
-            base64_strings = [item["embedding"] for item in content["data"]]
+    session = llm_client_registry.get(
+        ("siliconcloud", None, None),
+        lambda: aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=llm_client_registry.max_connections,
+                keepalive_timeout=llm_client_registry.keepalive_expiry,
+            )
+        ),
+    )
+    async with session.post(base_url, headers=headers, json=payload) as response:
+        content = await response.json()
+        if "code" in content:
+            raise ValueError(content)
+        base64_strings = [item["embedding"] for item in content["data"]]
 
     embeddings = []
     for string in base64_strings:
@@ -620,6 +821,106 @@ async def siliconcloud_embedding(
     return np.array(embeddings)
 
 
+class AdaptiveConcurrencyLimiter:
+    """Bound in-flight requests, adapting the bound to throttling (AIMD)
+
+    The limit starts at `max_concurrency`, is halved when a request is
+    throttled and grows back by one after a limit's worth of successes.
+    Entering returns the current generation, which every decrease bumps;
+    throttles of requests admitted before the last decrease are counted but
+    do not halve the limit again, so a burst of them is one decrease.
+    """
+
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.total_throttled = 0
+        self._successes = 0
+        self._generation = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+            return self._generation
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            self.limit = min(self.max_concurrency, self.limit + 1)
+
+    def on_throttle(self, generation: int):
+        self.total_throttled += 1
+        if generation != self._generation:
+            return
+        self._generation += 1
+        self._successes = 0
+        self.limit = max(self.min_concurrency, self.limit // 2)
+
+
+BEDROCK_THROTTLING_ERRORS = (
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+)
+
+
+async def _bedrock_runtime_client(endpoint_url=None, region_name=None):
+    async def _open():
+        session = aioboto3.Session()
+        client = session.client(
+            "bedrock-runtime",
+            endpoint_url=endpoint_url,
+            region_name=region_name,
+            # throttling is retried by the adaptive limiter, not by botocore
+            config=Config(retries={"total_max_attempts": 1}),
+        )
+        return await client.__aenter__()
+
+    return await llm_client_registry.aget(
+        ("bedrock", endpoint_url, os.environ.get("AWS_ACCESS_KEY_ID"), region_name),
+        _open,
+    )
+
+
+async def _invoke_titan_embedding(
+    bedrock_async_client,
+    limiter: AdaptiveConcurrencyLimiter,
+    model: str,
+    body: str,
+    max_retries: int,
+) -> list[float]:
+    for attempt in range(max_retries + 1):
+        async with limiter as generation:
+            try:
+                response = await bedrock_async_client.invoke_model(
+                    modelId=model,
+                    body=body,
+                    accept="application/json",
+                    contentType="application/json",
+                )
+                response_body = await response.get("body").json()
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in BEDROCK_THROTTLING_ERRORS:
+                    raise BedrockError(e)
+                limiter.on_throttle(generation)
+                if attempt == max_retries:
+                    raise BedrockError(e)
+            else:
+                limiter.on_success()
+                return response_body["embedding"]
+        await asyncio.sleep(min(20.0, 0.5 * 2**attempt) * (0.5 + random.random()))
+
+
 # @wrap_embedding_func_with_attrs(embedding_dim=1024, max_token_size=8192)
 # @retry(
 #     stop=stop_after_attempt(3),
@@ -632,7 +933,18 @@ async def bedrock_embedding(
     aws_access_key_id=None,
     aws_secret_access_key=None,
     aws_session_token=None,
+    max_concurrency: int = 8,
+    max_retries: int = 5,
+    endpoint_url: str = None,
+    region_name: str = None,
 ) -> np.ndarray:
+    """Embed `texts` with Bedrock over a session and client shared between calls
+
+    Titan takes one text per request, so the requests of a batch run
+    concurrently with at most `max_concurrency` in flight per model. Throttled
+    requests shrink that bound and are retried with backoff. `endpoint_url`
+    points the client at another bedrock-runtime endpoint, e.g. a local stub.
+    """
     os.environ["AWS_ACCESS_KEY_ID"] = os.environ.get(
         "AWS_ACCESS_KEY_ID", aws_access_key_id
     )
@@ -643,53 +955,55 @@ async def bedrock_embedding(
         "AWS_SESSION_TOKEN", aws_session_token
     )
 
-    session = aioboto3.Session()
-    async with session.client("bedrock-runtime") as bedrock_async_client:
-        if (model_provider := model.split(".")[0]) == "amazon":
-            embed_texts = []
-            for text in texts:
-                if "v2" in model:
-                    body = json.dumps(
-                        {
-                            "inputText": text,
-                            # 'dimensions': embedding_dim,
-                            "embeddingTypes": ["float"],
-                        }
-                    )
-                elif "v1" in model:
-                    body = json.dumps({"inputText": text})
-                else:
-                    raise ValueError(f"Model {model} is not supported!")
-
-                response = await bedrock_async_client.invoke_model(
-                    modelId=model,
-                    body=body,
-                    accept="application/json",
-                    contentType="application/json",
+    bedrock_async_client = await _bedrock_runtime_client(endpoint_url, region_name)
+    if (model_provider := model.split(".")[0]) == "amazon":
+        if "v2" in model:
+            bodies = [
+                json.dumps(
+                    {
+                        "inputText": text,
+                        # 'dimensions': embedding_dim,
+                        "embeddingTypes": ["float"],
+                    }
                 )
+                for text in texts
+            ]
+        elif "v1" in model:
+            bodies = [json.dumps({"inputText": text}) for text in texts]
+        else:
+            raise ValueError(f"Model {model} is not supported!")
 
-                response_body = await response.get("body").json()
-
-                embed_texts.append(response_body["embedding"])
-        elif model_provider == "cohere":
-            body = json.dumps(
-                {"texts": texts, "input_type": "search_document", "truncate": "NONE"}
-            )
+        limiter = llm_client_registry.get(
+            ("bedrock_limiter", endpoint_url, model, max_concurrency),
+            lambda: AdaptiveConcurrencyLimiter(max_concurrency),
+        )
+        embed_texts = await asyncio.gather(
+            *[
+                _invoke_titan_embedding(
+                    bedrock_async_client, limiter, model, body, max_retries
+                )
+                for body in bodies
+            ]
+        )
+    elif model_provider == "cohere":
+        body = json.dumps(
+            {"texts": texts, "input_type": "search_document", "truncate": "NONE"}
+        )
 
-            response = await bedrock_async_client.invoke_model(
-                model=model,
-                body=body,
-                accept="application/json",
-                contentType="application/json",
-            )
+        response = await bedrock_async_client.invoke_model(
+            model=model,
+            body=body,
+            accept="application/json",
+            contentType="application/json",
+        )
 
-            response_body = json.loads(response.get("body").read())
+        response_body = json.loads(response.get("body").read())
 
-            embed_texts = response_body["embeddings"]
-        else:
-            raise ValueError(f"Model provider '{model_provider}' is not supported!")
+        embed_texts = response_body["embeddings"]
+    else:
+        raise ValueError(f"Model provider '{model_provider}' is not supported!")
 
-        return np.array(embed_texts)
+    return np.array(embed_texts)
 
 
 async def hf_embedding(texts: list[str], tokenizer, embed_model) -> np.ndarray:
@@ -702,14 +1016,28 @@ async def hf_embedding(texts: list[str], tokenizer, embed_model) -> np.ndarray:
     return embeddings.detach().numpy()
 
 
-async def ollama_embedding(texts: list[str], embed_model, **kwargs) -> np.ndarray:
-    embed_text = []
-    ollama_client = ollama.Client(**kwargs)
-    for text in texts:
-        data = ollama_client.embeddings(model=embed_model, prompt=text)
-        embed_text.append(data["embedding"])
+async def ollama_embedding(
+    texts: list[str],
+    embed_model,
+    max_concurrency: int = 4,
+    **kwargs,
+) -> np.ndarray:
+    """Embed `texts` with Ollama, at most `max_concurrency` requests at a time
+
+    Each text is one `/api/embeddings` request over the shared `AsyncClient`;
+    the batch `/api/embed` endpoint needs ollama>=0.3, newer than the pinned
+    client. `kwargs` are client options such as `host` and `timeout`.
+    """
+    ollama_client = _ollama_client(**kwargs)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _embed_text(text: str) -> list[float]:
+        async with semaphore:
+            response = await ollama_client.embeddings(model=embed_model, prompt=text)
+        return response["embedding"]
 
-    return embed_text
+    embeddings = await asyncio.gather(*[_embed_text(text) for text in texts])
+    return np.array(embeddings, dtype=np.float32)
 
 
 class Model(BaseModel):
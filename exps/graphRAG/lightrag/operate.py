@@ -1,21 +1,28 @@
 import asyncio
 import json
 import re
-from typing import Union
+import time
+from typing import AsyncIterator, Union
 from collections import Counter, defaultdict
 import warnings
+from concurrent.futures import Executor
+from itertools import accumulate
 from .utils import (
     logger,
     clean_str,
     compute_mdhash_id,
     decode_tokens_by_tiktoken,
     encode_string_by_tiktoken,
+    get_tiktoken_encoder,
     is_float_regex,
     list_of_list_to_csv,
     pack_user_ass_to_openai_messages,
     split_string_by_multi_markers,
     truncate_list_by_token_size,
+    tokenizer_registry,
+    KeywordsCache,
     process_combine_contexts,
+    use_llm_cache_category,
 )
 from .base import (
     BaseGraphStorage,
@@ -30,22 +37,84 @@ from .prompt import GRAPH_FIELD_SEP, PROMPTS
 def chunking_by_token_size(
     content: str, overlap_token_size=128, max_token_size=1024, tiktoken_model="gpt-4o"
 ):
-    tokens = encode_string_by_tiktoken(content, model_name=tiktoken_model)
-    results = []
-    for index, start in enumerate(
-        range(0, len(tokens), max_token_size - overlap_token_size)
-    ):
-        chunk_content = decode_tokens_by_tiktoken(
-            tokens[start : start + max_token_size], model_name=tiktoken_model
-        )
-        results.append(
-            {
-                "tokens": min(max_token_size, len(tokens) - start),
-                "content": chunk_content.strip(),
-                "chunk_order_index": index,
-            }
+    return chunking_by_token_size_batch(
+        [content], overlap_token_size, max_token_size, tiktoken_model
+    )[0]
+
+
+def chunking_by_token_size_batch(
+    contents: list[str],
+    overlap_token_size=128,
+    max_token_size=1024,
+    tiktoken_model="gpt-4o",
+) -> list[list[dict]]:
+    """Chunk several contents at once, the result of each as `chunking_by_token_size`
+
+    The contents are tokenized with one batch encode. Each window is cut from
+    the content's UTF-8 bytes at its tokens' byte offsets instead of decoding
+    the overlapping token windows one by one. `tokens` counts the stripped
+    chunk content, as a later truncation of it would, so the chunks are
+    encoded once more in a second batch.
+    """
+    encoder = get_tiktoken_encoder(tiktoken_model)
+    step = max_token_size - overlap_token_size
+    all_results = []
+    for tokens in encoder.encode_batch(contents):
+        token_bytes = encoder.decode_tokens_bytes(tokens)
+        offsets = [0, *accumulate(map(len, token_bytes))]
+        raw = b"".join(token_bytes)
+        results = []
+        for index, start in enumerate(range(0, len(tokens), step)):
+            end = min(start + max_token_size, len(tokens))
+            chunk_content = raw[offsets[start] : offsets[end]].decode(
+                "utf-8", errors="replace"
+            )
+            results.append(
+                {"content": chunk_content.strip(), "chunk_order_index": index}
+            )
+        all_results.append(results)
+    chunks = [chunk for results in all_results for chunk in results]
+    chunk_tokens = encoder.encode_batch([chunk["content"] for chunk in chunks])
+    for chunk, tokens in zip(chunks, chunk_tokens):
+        chunk["tokens"] = len(tokens)
+    return all_results
+
+
+async def iter_chunks_by_token_size(
+    contents: list[str],
+    overlap_token_size=128,
+    max_token_size=1024,
+    tiktoken_model="gpt-4o",
+    executor: Executor = None,
+    num_shards: int = 1,
+) -> AsyncIterator[list[dict]]:
+    """Yield the chunks of each content in order, chunking off the event loop
+
+    `contents` is split into `num_shards` shards that are chunked concurrently
+    on `executor`, or in a thread of the loop's default executor if None; a
+    process pool lets chunking scale with cores. Results are yielded as soon
+    as the shard holding them is done.
+    """
+    loop = asyncio.get_running_loop()
+    shard_size = max(1, -(-len(contents) // max(1, num_shards)))
+    futures = [
+        loop.run_in_executor(
+            executor,
+            chunking_by_token_size_batch,
+            contents[start : start + shard_size],
+            overlap_token_size,
+            max_token_size,
+            tiktoken_model,
         )
-    return results
+        for start in range(0, len(contents), shard_size)
+    ]
+    try:
+        for future in futures:
+            for chunks in await future:
+                yield chunks
+    finally:
+        for future in futures:
+            future.cancel()
 
 
 async def _handle_entity_relation_summary(
@@ -71,7 +140,8 @@ async def _handle_entity_relation_summary(
     )
     use_prompt = prompt_template.format(**context_base)
     logger.debug(f"Trigger summary: {entity_or_relation_name}")
-    summary = await use_llm_func(use_prompt, max_tokens=summary_max_tokens)
+    with use_llm_cache_category("summary"):
+        summary = await use_llm_func(use_prompt, max_tokens=summary_max_tokens)
     return summary
 
 
@@ -122,17 +192,16 @@ async def _handle_single_relationship_extraction(
     )
 
 
-async def _merge_nodes_then_upsert(
+async def _merge_nodes(
     entity_name: str,
     nodes_data: list[dict],
-    knowledge_graph_inst: BaseGraphStorage,
+    already_node: Union[dict, None],
     global_config: dict,
-):
+) -> dict:
     already_entitiy_types = []
     already_source_ids = []
     already_description = []
 
-    already_node = await knowledge_graph_inst.get_node(entity_name)
     if already_node is not None:
         already_entitiy_types.append(already_node["entity_type"])
         already_source_ids.extend(
@@ -156,33 +225,26 @@ async def _merge_nodes_then_upsert(
     description = await _handle_entity_relation_summary(
         entity_name, description, global_config
     )
-    node_data = dict(
+    return dict(
         entity_type=entity_type,
         description=description,
         source_id=source_id,
     )
-    await knowledge_graph_inst.upsert_node(
-        entity_name,
-        node_data=node_data,
-    )
-    node_data["entity_name"] = entity_name
-    return node_data
 
 
-async def _merge_edges_then_upsert(
+async def _merge_edges(
     src_id: str,
     tgt_id: str,
     edges_data: list[dict],
-    knowledge_graph_inst: BaseGraphStorage,
+    already_edge: Union[dict, None],
     global_config: dict,
-):
+) -> dict:
     already_weights = []
     already_source_ids = []
     already_description = []
     already_keywords = []
 
-    if await knowledge_graph_inst.has_edge(src_id, tgt_id):
-        already_edge = await knowledge_graph_inst.get_edge(src_id, tgt_id)
+    if already_edge is not None:
         already_weights.append(already_edge["weight"])
         already_source_ids.extend(
             split_string_by_multi_markers(already_edge["source_id"], [GRAPH_FIELD_SEP])
@@ -202,51 +264,156 @@ async def _merge_edges_then_upsert(
     source_id = GRAPH_FIELD_SEP.join(
         set([dp["source_id"] for dp in edges_data] + already_source_ids)
     )
-    for need_insert_id in [src_id, tgt_id]:
-        if not (await knowledge_graph_inst.has_node(need_insert_id)):
-            await knowledge_graph_inst.upsert_node(
+    return dict(
+        weight=weight,
+        description=description,
+        keywords=keywords,
+        source_id=source_id,
+    )
+
+
+def _set_description_tokens(datas: list[dict], global_config: dict):
+    """Store the token count of each description, so queries need not count it"""
+    counts = tokenizer_registry.count_tokens_batch(
+        [data["description"] for data in datas], global_config["tiktoken_model_name"]
+    )
+    for data, count in zip(datas, counts):
+        data["description_tokens"] = count
+
+
+async def _merge_nodes_then_upsert(
+    maybe_nodes: dict[str, list[dict]],
+    knowledge_graph_inst: BaseGraphStorage,
+    global_config: dict,
+) -> list[dict]:
+    entity_names = list(maybe_nodes)
+    already_nodes = await knowledge_graph_inst.get_nodes(entity_names)
+    nodes = await asyncio.gather(
+        *[
+            _merge_nodes(k, maybe_nodes[k], already, global_config)
+            for k, already in zip(entity_names, already_nodes)
+        ]
+    )
+    _set_description_tokens(nodes, global_config)
+    await knowledge_graph_inst.upsert_nodes(list(zip(entity_names, nodes)))
+    return [
+        {**node_data, "entity_name": entity_name}
+        for entity_name, node_data in zip(entity_names, nodes)
+    ]
+
+
+async def _merge_edges_then_upsert(
+    maybe_edges: dict[tuple[str, str], list[dict]],
+    knowledge_graph_inst: BaseGraphStorage,
+    global_config: dict,
+) -> list[dict]:
+    edge_keys = list(maybe_edges)
+    already_edges = await knowledge_graph_inst.get_edges(edge_keys)
+    edges = await asyncio.gather(
+        *[
+            _merge_edges(k[0], k[1], maybe_edges[k], already, global_config)
+            for k, already in zip(edge_keys, already_edges)
+        ]
+    )
+
+    # endpoints the extraction never described as entities get a placeholder
+    # node built from the first edge that mentions them
+    placeholders = {}
+    for (src_id, tgt_id), edge_data in zip(edge_keys, edges):
+        for need_insert_id in [src_id, tgt_id]:
+            placeholders.setdefault(
                 need_insert_id,
-                node_data={
-                    "source_id": source_id,
-                    "description": description,
+                {
+                    "source_id": edge_data["source_id"],
+                    "description": edge_data["description"],
                     "entity_type": '"UNKNOWN"',
                 },
             )
-    description = await _handle_entity_relation_summary(
-        (src_id, tgt_id), description, global_config
+    endpoint_ids = list(placeholders)
+    endpoint_nodes = await knowledge_graph_inst.get_nodes(endpoint_ids)
+    missing = [
+        (node_id, placeholders[node_id])
+        for node_id, node in zip(endpoint_ids, endpoint_nodes)
+        if node is None
+    ]
+    if missing:
+        _set_description_tokens([node for _, node in missing], global_config)
+        await knowledge_graph_inst.upsert_nodes(missing)
+
+    descriptions = await asyncio.gather(
+        *[
+            _handle_entity_relation_summary(k, edge_data["description"], global_config)
+            for k, edge_data in zip(edge_keys, edges)
+        ]
     )
-    await knowledge_graph_inst.upsert_edge(
-        src_id,
-        tgt_id,
-        edge_data=dict(
-            weight=weight,
-            description=description,
-            keywords=keywords,
-            source_id=source_id,
-        ),
+    for edge_data, description in zip(edges, descriptions):
+        edge_data["description"] = description
+    _set_description_tokens(edges, global_config)
+    await knowledge_graph_inst.upsert_edges(
+        [(k[0], k[1], edge_data) for k, edge_data in zip(edge_keys, edges)]
     )
+    return [
+        dict(
+            src_id=k[0],
+            tgt_id=k[1],
+            description=edge_data["description"],
+            keywords=edge_data["keywords"],
+        )
+        for k, edge_data in zip(edge_keys, edges)
+    ]
 
-    edge_data = dict(
-        src_id=src_id,
-        tgt_id=tgt_id,
-        description=description,
-        keywords=keywords,
-    )
 
-    return edge_data
+def _pack_extraction_checkpoint(maybe_nodes: dict, maybe_edges: dict) -> dict:
+    return {
+        "nodes": [dp for v in maybe_nodes.values() for dp in v],
+        "edges": [dp for v in maybe_edges.values() for dp in v],
+    }
 
 
-async def extract_entities(
+def _unpack_extraction_checkpoint(checkpoint: dict) -> tuple[dict, dict]:
+    maybe_nodes = defaultdict(list)
+    maybe_edges = defaultdict(list)
+    for dp in checkpoint["nodes"]:
+        maybe_nodes[dp["entity_name"]].append(dp)
+    for dp in checkpoint["edges"]:
+        maybe_edges[(dp["src_id"], dp["tgt_id"])].append(dp)
+    return dict(maybe_nodes), dict(maybe_edges)
+
+
+async def extract_chunk_entities(
     chunks: dict[str, TextChunkSchema],
-    knowledge_graph_inst: BaseGraphStorage,
-    entity_vdb: BaseVectorStorage,
-    relationships_vdb: BaseVectorStorage,
     global_config: dict,
-) -> Union[BaseGraphStorage, None]:
+    checkpoint_kv: BaseKVStorage = None,
+) -> list[tuple[dict, dict]]:
+    """Run the LLM extraction over each chunk, return (maybe_nodes, maybe_edges) per chunk
+
+    If `checkpoint_kv` is given, each chunk's result is written to it as soon
+    as its gleaning loop finishes, and chunks already found there are not sent
+    to the LLM again. The checkpoints are flushed every
+    `extraction_checkpoint_flush_chunks` chunks or
+    `extraction_checkpoint_flush_interval` seconds, whichever comes first.
+    """
     use_llm_func: callable = global_config["llm_model_func"]
     entity_extract_max_gleaning = global_config["entity_extract_max_gleaning"]
+    flush_chunks = global_config["extraction_checkpoint_flush_chunks"]
+    flush_interval = global_config["extraction_checkpoint_flush_interval"]
+    unflushed_checkpoints = 0
+    last_flush = time.monotonic()
 
     ordered_chunks = list(chunks.items())
+    resumed_results = []
+    if checkpoint_kv is not None:
+        checkpoints = await checkpoint_kv.get_by_ids([k for k, _ in ordered_chunks])
+        resumed_results = [
+            _unpack_extraction_checkpoint(c) for c in checkpoints if c is not None
+        ]
+        if resumed_results:
+            logger.info(
+                f"Resuming {len(resumed_results)} chunks from extraction checkpoints"
+            )
+            ordered_chunks = [
+                c for c, cp in zip(ordered_chunks, checkpoints) if cp is None
+            ]
 
     entity_extract_prompt = PROMPTS["entity_extraction"]
     context_base = dict(
@@ -264,24 +431,30 @@ async def extract_entities(
 
     async def _process_single_content(chunk_key_dp: tuple[str, TextChunkSchema]):
         nonlocal already_processed, already_entities, already_relations
+        nonlocal unflushed_checkpoints, last_flush
         chunk_key = chunk_key_dp[0]
         chunk_dp = chunk_key_dp[1]
         content = chunk_dp["content"]
         hint_prompt = entity_extract_prompt.format(**context_base, input_text=content)
-        final_result = await use_llm_func(hint_prompt)
+        with use_llm_cache_category("extraction"):
+            final_result = await use_llm_func(hint_prompt)
 
         history = pack_user_ass_to_openai_messages(hint_prompt, final_result)
         for now_glean_index in range(entity_extract_max_gleaning):
-            glean_result = await use_llm_func(continue_prompt, history_messages=history)
+            with use_llm_cache_category("gleaning"):
+                glean_result = await use_llm_func(
+                    continue_prompt, history_messages=history
+                )
 
             history += pack_user_ass_to_openai_messages(continue_prompt, glean_result)
             final_result += glean_result
             if now_glean_index == entity_extract_max_gleaning - 1:
                 break
 
-            if_loop_result: str = await use_llm_func(
-                if_loop_prompt, history_messages=history
-            )
+            with use_llm_cache_category("gleaning"):
+                if_loop_result: str = await use_llm_func(
+                    if_loop_prompt, history_messages=history
+                )
             if_loop_result = if_loop_result.strip().strip('"').strip("'").lower()
             if if_loop_result != "yes":
                 break
@@ -315,6 +488,18 @@ async def extract_entities(
                 maybe_edges[(if_relation["src_id"], if_relation["tgt_id"])].append(
                     if_relation
                 )
+        if checkpoint_kv is not None:
+            await checkpoint_kv.upsert(
+                {chunk_key: _pack_extraction_checkpoint(maybe_nodes, maybe_edges)}
+            )
+            unflushed_checkpoints += 1
+            if (
+                unflushed_checkpoints >= flush_chunks
+                or time.monotonic() - last_flush >= flush_interval
+            ):
+                unflushed_checkpoints = 0
+                last_flush = time.monotonic()
+                await checkpoint_kv.index_done_callback()
         already_processed += 1
         already_entities += len(maybe_nodes)
         already_relations += len(maybe_edges)
@@ -333,6 +518,19 @@ async def extract_entities(
         *[_process_single_content(c) for c in ordered_chunks]
     )
     print()  # clear the progress bar
+    if checkpoint_kv is not None and unflushed_checkpoints:
+        await checkpoint_kv.index_done_callback()
+    return resumed_results + results
+
+
+async def merge_chunk_entities(
+    results: list[tuple[dict, dict]],
+    knowledge_graph_inst: BaseGraphStorage,
+    entity_vdb: BaseVectorStorage,
+    relationships_vdb: BaseVectorStorage,
+    global_config: dict,
+) -> Union[BaseGraphStorage, None]:
+    """Merge per-chunk extraction results into the graph and the vector dbs"""
     maybe_nodes = defaultdict(list)
     maybe_edges = defaultdict(list)
     for m_nodes, m_edges in results:
@@ -340,17 +538,11 @@ async def extract_entities(
             maybe_nodes[k].extend(v)
         for k, v in m_edges.items():
             maybe_edges[tuple(sorted(k))].extend(v)
-    all_entities_data = await asyncio.gather(
-        *[
-            _merge_nodes_then_upsert(k, v, knowledge_graph_inst, global_config)
-            for k, v in maybe_nodes.items()
-        ]
+    all_entities_data = await _merge_nodes_then_upsert(
+        maybe_nodes, knowledge_graph_inst, global_config
     )
-    all_relationships_data = await asyncio.gather(
-        *[
-            _merge_edges_then_upsert(k[0], k[1], v, knowledge_graph_inst, global_config)
-            for k, v in maybe_edges.items()
-        ]
+    all_relationships_data = await _merge_edges_then_upsert(
+        maybe_edges, knowledge_graph_inst, global_config
     )
     if not len(all_entities_data):
         logger.warning("Didn't extract any entities, maybe your LLM is not working")
@@ -388,6 +580,140 @@ async def extract_entities(
     return knowledge_graph_inst
 
 
+async def extract_entities(
+    chunks: dict[str, TextChunkSchema],
+    knowledge_graph_inst: BaseGraphStorage,
+    entity_vdb: BaseVectorStorage,
+    relationships_vdb: BaseVectorStorage,
+    global_config: dict,
+) -> Union[BaseGraphStorage, None]:
+    results = await extract_chunk_entities(chunks, global_config)
+    return await merge_chunk_entities(
+        results, knowledge_graph_inst, entity_vdb, relationships_vdb, global_config
+    )
+
+
+def _semantic_cache_kwargs(global_config: dict, prompt_type: str, text: str) -> dict:
+    """Key a query-path LLM call for the optional semantic LLM cache"""
+    if not global_config.get("enable_semantic_llm_cache"):
+        return {}
+    return {"semantic_cache_key": (prompt_type, text)}
+
+
+def _parse_keywords_response(
+    result: str, kw_prompt: str
+) -> Union[tuple[list[str], list[str]], None]:
+    try:
+        keywords_data = json.loads(result)
+    except json.JSONDecodeError:
+        # not plain JSON: drop an echoed prompt and role markers, then parse
+        # the first {...} body of the response
+        result = (
+            result.replace(kw_prompt[:-1], "")
+            .replace("user", "")
+            .replace("model", "")
+            .strip()
+        )
+        try:
+            keywords_data = json.loads("{" + result.split("{")[1].split("}")[0] + "}")
+        except (IndexError, json.JSONDecodeError) as e:
+            logger.warning(f"JSON parsing error of the extracted keywords: {e}")
+            return None
+    if not isinstance(keywords_data, dict):
+        return None
+    return (
+        keywords_data.get("high_level_keywords", []),
+        keywords_data.get("low_level_keywords", []),
+    )
+
+
+async def extract_keywords(
+    query: str, global_config: dict, keywords_cache: KeywordsCache = None
+) -> Union[tuple[list[str], list[str]], None]:
+    """Return the (high-level, low-level) keywords of `query`, None if unparsable
+
+    With `keywords_cache`, the keywords of a query are extracted once and
+    shared by every query mode until the entry expires.
+    """
+
+    async def _extract():
+        use_model_func = global_config["llm_model_func"]
+        kw_prompt = PROMPTS["keywords_extraction"].format(query=query)
+        with use_llm_cache_category("keywords"):
+            result = await use_model_func(
+                kw_prompt,
+                **_semantic_cache_kwargs(global_config, "keywords_extraction", query),
+            )
+        return _parse_keywords_response(result, kw_prompt)
+
+    if keywords_cache is None:
+        return await _extract()
+    return await keywords_cache.get_or_compute(query, _extract)
+
+
+class _SharedReads:
+    """Memoize the batch reads of a graph or KV storage for one query
+
+    Context builders that run concurrently for the same query read through
+    one instance, so a node, edge, degree or chunk that several of them need
+    is fetched from the storage once; reads already in flight are awaited
+    instead of issued again. Other attributes pass through to the storage.
+    """
+
+    def __init__(self, storage: Union[BaseGraphStorage, BaseKVStorage]):
+        self._storage = storage
+        self._memo: dict[str, dict] = defaultdict(dict)
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+    async def _read(self, method: str, keys: list) -> list:
+        memo = self._memo[method]
+        missing = list(dict.fromkeys(k for k in keys if k not in memo))
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {k: loop.create_future() for k in missing}
+            memo.update(futures)
+            try:
+                values = await getattr(self._storage, method)(missing)
+            except BaseException as e:
+                for k, future in futures.items():
+                    del memo[k]
+                    if isinstance(e, asyncio.CancelledError):
+                        future.cancel()
+                    else:
+                        future.set_exception(e)
+                        # mark it retrieved, only readers still waiting see it
+                        future.exception()
+                raise
+            for k, value in zip(missing, values):
+                futures[k].set_result(value)
+        return [await memo[k] for k in keys]
+
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        return await self._read("get_nodes", node_ids)
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        return await self._read("node_degrees", node_ids)
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        return await self._read("get_edges", edges)
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        return await self._read("edge_degrees", edges)
+
+    async def get_nodes_edges(self, node_ids: list[str]) -> list[list[tuple[str, str]]]:
+        return await self._read("get_nodes_edges", node_ids)
+
+    async def get_by_id(self, id):
+        return (await self._read("get_by_ids", [id]))[0]
+
+    async def get_by_ids(self, ids, fields=None):
+        if fields is not None:
+            return await self._storage.get_by_ids(ids, fields)
+        return await self._read("get_by_ids", ids)
+
+
 async def local_query(
     query,
     knowledge_graph_inst: BaseGraphStorage,
@@ -396,42 +722,23 @@ async def local_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
+    keywords_cache: KeywordsCache = None,
 ) -> str:
     context = None
     use_model_func = global_config["llm_model_func"]
 
-    kw_prompt_temp = PROMPTS["keywords_extraction"]
-    kw_prompt = kw_prompt_temp.format(query=query)
-    result = await use_model_func(kw_prompt)
-
-    try:
-        keywords_data = json.loads(result)
-        keywords = keywords_data.get("low_level_keywords", [])
-        keywords = ", ".join(keywords)
-    except json.JSONDecodeError:
-        try:
-            result = (
-                result.replace(kw_prompt[:-1], "")
-                .replace("user", "")
-                .replace("model", "")
-                .strip()
-            )
-            result = "{" + result.split("{")[1].split("}")[0] + "}"
-
-            keywords_data = json.loads(result)
-            keywords = keywords_data.get("low_level_keywords", [])
-            keywords = ", ".join(keywords)
-        # Handle parsing error
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            return PROMPTS["fail_response"]
+    keywords = await extract_keywords(query, global_config, keywords_cache)
+    if keywords is None:
+        return PROMPTS["fail_response"]
+    keywords = ", ".join(keywords[1])
     if keywords:
         context = await _build_local_query_context(
             keywords,
-            knowledge_graph_inst,
+            _SharedReads(knowledge_graph_inst),
             entities_vdb,
             text_chunks_db,
             query_param,
+            global_config,
         )
     if query_param.only_need_context:
         return context
@@ -441,10 +748,16 @@ async def local_query(
     sys_prompt = sys_prompt_temp.format(
         context_data=context, response_type=query_param.response_type
     )
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
+    with use_llm_cache_category("response"):
+        response = await use_model_func(
+            query,
+            system_prompt=sys_prompt,
+            **_semantic_cache_kwargs(
+                global_config,
+                f"{query_param.mode}_response:{query_param.response_type}",
+                query,
+            ),
+        )
     if len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
@@ -465,29 +778,29 @@ async def _build_local_query_context(
     entities_vdb: BaseVectorStorage,
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
+    global_config: dict,
 ):
     results = await entities_vdb.query(query, top_k=query_param.top_k)
 
     if not len(results):
         return None
-    node_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(r["entity_name"]) for r in results]
+    entity_names = [r["entity_name"] for r in results]
+    node_datas, node_degrees = await asyncio.gather(
+        knowledge_graph_inst.get_nodes(entity_names),
+        knowledge_graph_inst.node_degrees(entity_names),
     )
     if not all([n is not None for n in node_datas]):
         logger.warning("Some nodes are missing, maybe the storage is damaged")
-    node_degrees = await asyncio.gather(
-        *[knowledge_graph_inst.node_degree(r["entity_name"]) for r in results]
-    )
     node_datas = [
         {**n, "entity_name": k["entity_name"], "rank": d}
         for k, n, d in zip(results, node_datas, node_degrees)
         if n is not None
     ]  # what is this text_chunks_db doing.  dont remember it in airvx.  check the diagram.
     use_text_units = await _find_most_related_text_unit_from_entities(
-        node_datas, query_param, text_chunks_db, knowledge_graph_inst
+        node_datas, query_param, text_chunks_db, knowledge_graph_inst, global_config
     )
     use_relations = await _find_most_related_edges_from_entities(
-        node_datas, query_param, knowledge_graph_inst
+        node_datas, query_param, knowledge_graph_inst, global_config
     )
     logger.info(
         f"Local query uses {len(node_datas)} entites, {len(use_relations)} relations, {len(use_text_units)} text units"
@@ -547,13 +860,14 @@ async def _find_most_related_text_unit_from_entities(
     query_param: QueryParam,
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     knowledge_graph_inst: BaseGraphStorage,
+    global_config: dict,
 ):
     text_units = [
         split_string_by_multi_markers(dp["source_id"], [GRAPH_FIELD_SEP])
         for dp in node_datas
     ]
-    edges = await asyncio.gather(
-        *[knowledge_graph_inst.get_node_edges(dp["entity_name"]) for dp in node_datas]
+    edges = await knowledge_graph_inst.get_nodes_edges(
+        [dp["entity_name"] for dp in node_datas]
     )
     all_one_hop_nodes = set()
     for this_edges in edges:
@@ -562,9 +876,7 @@ async def _find_most_related_text_unit_from_entities(
         all_one_hop_nodes.update([e[1] for e in this_edges])
     
     all_one_hop_nodes = list(all_one_hop_nodes)
-    all_one_hop_nodes_data = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(e) for e in all_one_hop_nodes]
-    )
+    all_one_hop_nodes_data = await knowledge_graph_inst.get_nodes(all_one_hop_nodes)
     
     # Add null check for node data
     all_one_hop_text_units_lookup = {
@@ -573,6 +885,9 @@ async def _find_most_related_text_unit_from_entities(
         if v is not None and "source_id" in v  # Add source_id check
     }
     
+    chunk_ids = list(dict.fromkeys(c_id for ids in text_units for c_id in ids))
+    chunks = dict(zip(chunk_ids, await text_chunks_db.get_by_ids(chunk_ids)))
+
     all_text_units_lookup = {}
     for index, (this_text_units, this_edges) in enumerate(zip(text_units, edges)):
         for c_id in this_text_units:
@@ -587,7 +902,7 @@ async def _find_most_related_text_unit_from_entities(
                     ):
                         relation_counts += 1
             
-            chunk_data = await text_chunks_db.get_by_id(c_id)
+            chunk_data = chunks[c_id]
             if chunk_data is not None and "content" in chunk_data:  # Add content check
                 all_text_units_lookup[c_id] = {
                     "data": chunk_data,
@@ -615,6 +930,8 @@ async def _find_most_related_text_unit_from_entities(
         all_text_units,
         key=lambda x: x["data"]["content"],
         max_token_size=query_param.max_token_for_text_unit,
+        token_count=lambda x: x["data"].get("tokens"),
+        model_name=global_config["tiktoken_model_name"],
     )
     
     all_text_units = [t["data"] for t in all_text_units]
@@ -625,19 +942,18 @@ async def _find_most_related_edges_from_entities(
     node_datas: list[dict],
     query_param: QueryParam,
     knowledge_graph_inst: BaseGraphStorage,
+    global_config: dict,
 ):
-    all_related_edges = await asyncio.gather(
-        *[knowledge_graph_inst.get_node_edges(dp["entity_name"]) for dp in node_datas]
+    all_related_edges = await knowledge_graph_inst.get_nodes_edges(
+        [dp["entity_name"] for dp in node_datas]
     )
     all_edges = set()
     for this_edges in all_related_edges:
         all_edges.update([tuple(sorted(e)) for e in this_edges])
     all_edges = list(all_edges)
-    all_edges_pack = await asyncio.gather(
-        *[knowledge_graph_inst.get_edge(e[0], e[1]) for e in all_edges]
-    )
-    all_edges_degree = await asyncio.gather(
-        *[knowledge_graph_inst.edge_degree(e[0], e[1]) for e in all_edges]
+    all_edges_pack, all_edges_degree = await asyncio.gather(
+        knowledge_graph_inst.get_edges(all_edges),
+        knowledge_graph_inst.edge_degrees(all_edges),
     )
     all_edges_data = [
         {"src_tgt": k, "rank": d, **v}
@@ -651,6 +967,8 @@ async def _find_most_related_edges_from_entities(
         all_edges_data,
         key=lambda x: x["description"],
         max_token_size=query_param.max_token_for_global_context,
+        token_count=lambda x: x.get("description_tokens"),
+        model_name=global_config["tiktoken_model_name"],
     )
     return all_edges_data
 
@@ -663,36 +981,15 @@ async def global_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
+    keywords_cache: KeywordsCache = None,
 ) -> str:
     context = None
     use_model_func = global_config["llm_model_func"]
 
-    kw_prompt_temp = PROMPTS["keywords_extraction"]
-    kw_prompt = kw_prompt_temp.format(query=query)
-    result = await use_model_func(kw_prompt)
-
-    try:
-        keywords_data = json.loads(result)
-        keywords = keywords_data.get("high_level_keywords", [])
-        keywords = ", ".join(keywords)
-    except json.JSONDecodeError:
-        try:
-            result = (
-                result.replace(kw_prompt[:-1], "")
-                .replace("user", "")
-                .replace("model", "")
-                .strip()
-            )
-            result = "{" + result.split("{")[1].split("}")[0] + "}"
-
-            keywords_data = json.loads(result)
-            keywords = keywords_data.get("high_level_keywords", [])
-            keywords = ", ".join(keywords)
-
-        except json.JSONDecodeError as e:
-            # Handle parsing error
-            print(f"JSON parsing error: {e}")
-            return PROMPTS["fail_response"]
+    keywords = await extract_keywords(query, global_config, keywords_cache)
+    if keywords is None:
+        return PROMPTS["fail_response"]
+    keywords = ", ".join(keywords[0])
     if keywords:
         context = await _build_global_query_context(
             keywords,
@@ -701,6 +998,7 @@ async def global_query(
             relationships_vdb,
             text_chunks_db,
             query_param,
+            global_config,
         )
 
     if query_param.only_need_context:
@@ -712,10 +1010,16 @@ async def global_query(
     sys_prompt = sys_prompt_temp.format(
         context_data=context, response_type=query_param.response_type
     )
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
+    with use_llm_cache_category("response"):
+        response = await use_model_func(
+            query,
+            system_prompt=sys_prompt,
+            **_semantic_cache_kwargs(
+                global_config,
+                f"{query_param.mode}_response:{query_param.response_type}",
+                query,
+            ),
+        )
     if len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
@@ -737,21 +1041,21 @@ async def _build_global_query_context(
     relationships_vdb: BaseVectorStorage,
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
+    global_config: dict,
 ):
     results = await relationships_vdb.query(keywords, top_k=query_param.top_k)
 
     if not len(results):
         return None
 
-    edge_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_edge(r["src_id"], r["tgt_id"]) for r in results]
+    edge_keys = [(r["src_id"], r["tgt_id"]) for r in results]
+    edge_datas, edge_degree = await asyncio.gather(
+        knowledge_graph_inst.get_edges(edge_keys),
+        knowledge_graph_inst.edge_degrees(edge_keys),
     )
 
     if not all([n is not None for n in edge_datas]):
         logger.warning("Some edges are missing, maybe the storage is damaged")
-    edge_degree = await asyncio.gather(
-        *[knowledge_graph_inst.edge_degree(r["src_id"], r["tgt_id"]) for r in results]
-    )
     edge_datas = [
         {"src_id": k["src_id"], "tgt_id": k["tgt_id"], "rank": d, **v}
         for k, v, d in zip(results, edge_datas, edge_degree)
@@ -764,13 +1068,15 @@ async def _build_global_query_context(
         edge_datas,
         key=lambda x: x["description"],
         max_token_size=query_param.max_token_for_global_context,
+        token_count=lambda x: x.get("description_tokens"),
+        model_name=global_config["tiktoken_model_name"],
     )
 
     use_entities = await _find_most_related_entities_from_relationships(
-        edge_datas, query_param, knowledge_graph_inst
+        edge_datas, query_param, knowledge_graph_inst, global_config
     )
     use_text_units = await _find_related_text_unit_from_relationships(
-        edge_datas, query_param, text_chunks_db, knowledge_graph_inst
+        edge_datas, query_param, text_chunks_db, knowledge_graph_inst, global_config
     )
     logger.info(
         f"Global query uses {len(use_entities)} entites, {len(edge_datas)} relations, {len(use_text_units)} text units"
@@ -830,18 +1136,17 @@ async def _find_most_related_entities_from_relationships(
     edge_datas: list[dict],
     query_param: QueryParam,
     knowledge_graph_inst: BaseGraphStorage,
+    global_config: dict,
 ):
     entity_names = set()
     for e in edge_datas:
         entity_names.add(e["src_id"])
         entity_names.add(e["tgt_id"])
+    entity_names = list(entity_names)
 
-    node_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(entity_name) for entity_name in entity_names]
-    )
-
-    node_degrees = await asyncio.gather(
-        *[knowledge_graph_inst.node_degree(entity_name) for entity_name in entity_names]
+    node_datas, node_degrees = await asyncio.gather(
+        knowledge_graph_inst.get_nodes(entity_names),
+        knowledge_graph_inst.node_degrees(entity_names),
     )
     node_datas = [
         {**n, "entity_name": k, "rank": d}
@@ -852,6 +1157,8 @@ async def _find_most_related_entities_from_relationships(
         node_datas,
         key=lambda x: x["description"],
         max_token_size=query_param.max_token_for_local_context,
+        token_count=lambda x: x.get("description_tokens"),
+        model_name=global_config["tiktoken_model_name"],
     )
 
     return node_datas
@@ -862,19 +1169,23 @@ async def _find_related_text_unit_from_relationships(
     query_param: QueryParam,
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     knowledge_graph_inst: BaseGraphStorage,
+    global_config: dict,
 ):
     text_units = [
         split_string_by_multi_markers(dp["source_id"], [GRAPH_FIELD_SEP])
         for dp in edge_datas
     ]
 
+    chunk_ids = list(dict.fromkeys(c_id for ids in text_units for c_id in ids))
+    chunks = dict(zip(chunk_ids, await text_chunks_db.get_by_ids(chunk_ids)))
+
     all_text_units_lookup = {}
 
     for index, unit_list in enumerate(text_units):
         for c_id in unit_list:
             if c_id not in all_text_units_lookup:
                 all_text_units_lookup[c_id] = {
-                    "data": await text_chunks_db.get_by_id(c_id),
+                    "data": chunks[c_id],
                     "order": index,
                 }
 
@@ -888,6 +1199,8 @@ async def _find_related_text_unit_from_relationships(
         all_text_units,
         key=lambda x: x["data"]["content"],
         max_token_size=query_param.max_token_for_text_unit,
+        token_count=lambda x: x["data"].get("tokens"),
+        model_name=global_config["tiktoken_model_name"],
     )
     all_text_units: list[TextChunkSchema] = [t["data"] for t in all_text_units]
 
@@ -902,59 +1215,49 @@ async def hybrid_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
+    keywords_cache: KeywordsCache = None,
 ) -> str:
-    low_level_context = None
-    high_level_context = None
     use_model_func = global_config["llm_model_func"]
 
-    kw_prompt_temp = PROMPTS["keywords_extraction"]
-    kw_prompt = kw_prompt_temp.format(query=query)
+    keywords = await extract_keywords(query, global_config, keywords_cache)
+    if keywords is None:
+        return PROMPTS["fail_response"]
+    hl_keywords = ", ".join(keywords[0])
+    ll_keywords = ", ".join(keywords[1])
 
-    result = await use_model_func(kw_prompt)
-    try:
-        keywords_data = json.loads(result)
-        hl_keywords = keywords_data.get("high_level_keywords", [])
-        ll_keywords = keywords_data.get("low_level_keywords", [])
-        hl_keywords = ", ".join(hl_keywords)
-        ll_keywords = ", ".join(ll_keywords)
-    except json.JSONDecodeError:
-        try:
-            result = (
-                result.replace(kw_prompt[:-1], "")
-                .replace("user", "")
-                .replace("model", "")
-                .strip()
-            )
-            result = "{" + result.split("{")[1].split("}")[0] + "}"
-            keywords_data = json.loads(result)
-            hl_keywords = keywords_data.get("high_level_keywords", [])
-            ll_keywords = keywords_data.get("low_level_keywords", [])
-            hl_keywords = ", ".join(hl_keywords)
-            ll_keywords = ", ".join(ll_keywords)
-        # Handle parsing error
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            return PROMPTS["fail_response"]
-
-    if ll_keywords:
-        low_level_context = await _build_local_query_context(
+    # both branches run concurrently and share their graph and chunk reads
+    knowledge_graph_inst = _SharedReads(knowledge_graph_inst)
+    text_chunks_db = _SharedReads(text_chunks_db)
+
+    async def _low_level_context():
+        if not ll_keywords:
+            return None
+        return await _build_local_query_context(
             ll_keywords,
             knowledge_graph_inst,
             entities_vdb,
             text_chunks_db,
             query_param,
+            global_config,
         )
 
-    if hl_keywords:
-        high_level_context = await _build_global_query_context(
+    async def _high_level_context():
+        if not hl_keywords:
+            return None
+        return await _build_global_query_context(
             hl_keywords,
             knowledge_graph_inst,
             entities_vdb,
             relationships_vdb,
             text_chunks_db,
             query_param,
+            global_config,
         )
 
+    low_level_context, high_level_context = await asyncio.gather(
+        _low_level_context(), _high_level_context()
+    )
+
     context = combine_contexts(high_level_context, low_level_context)
 
     if query_param.only_need_context:
@@ -966,10 +1269,16 @@ async def hybrid_query(
     sys_prompt = sys_prompt_temp.format(
         context_data=context, response_type=query_param.response_type
     )
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
+    with use_llm_cache_category("response"):
+        response = await use_model_func(
+            query,
+            system_prompt=sys_prompt,
+            **_semantic_cache_kwargs(
+                global_config,
+                f"{query_param.mode}_response:{query_param.response_type}",
+                query,
+            ),
+        )
     if len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
@@ -1067,6 +1376,8 @@ async def naive_query(
         chunks,
         key=lambda x: x["content"],
         max_token_size=query_param.max_token_for_text_unit,
+        model_name=global_config["tiktoken_model_name"],
+        token_count=lambda x: x.get("tokens"),
     )
     logger.info(f"Truncate {len(chunks)} to {len(maybe_trun_chunks)} chunks")
     section = "--New Chunk--\n".join([c["content"] for c in maybe_trun_chunks])
@@ -1076,10 +1387,16 @@ async def naive_query(
     sys_prompt = sys_prompt_temp.format(
         content_data=section, response_type=query_param.response_type
     )
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
+    with use_llm_cache_category("response"):
+        response = await use_model_func(
+            query,
+            system_prompt=sys_prompt,
+            **_semantic_cache_kwargs(
+                global_config,
+                f"{query_param.mode}_response:{query_param.response_type}",
+                query,
+            ),
+        )
 
     if len(response) > len(sys_prompt):
         response = (
@@ -1,13 +1,21 @@
 import asyncio
 import html
+import json
+import math
 import os
+import sqlite3
+import struct
+import time
+import zlib
+from array import array
+from bisect import bisect_left
 from dataclasses import dataclass
 from typing import Any, Union, cast
 import networkx as nx
 import numpy as np
 from nano_vectordb import NanoVectorDB
 
-from .utils import load_json, logger, write_json
+from .utils import llm_cache_category, load_json, logger, write_json
 from .base import (
     BaseGraphStorage,
     BaseKVStorage,
@@ -52,10 +60,595 @@ class JsonKVStorage(BaseKVStorage):
         self._data.update(left_data)
         return left_data
 
+    async def delete(self, ids: list[str]):
+        for id in ids:
+            self._data.pop(id, None)
+
     async def drop(self):
         self._data = {}
 
 
+@dataclass
+class JsonLogKVStorage(BaseKVStorage):
+    """Append-only, log-structured KV storage.
+
+    Upserts are buffered in memory and appended to `kv_store_<namespace>.log`
+    on `index_done_callback`, so a commit costs what changed rather than the
+    whole store. Each line is `<json key>\t<json value>`, an empty value marks
+    a delete. Only an offset index is kept in memory, values are read from the
+    log on demand. The log is compacted in a worker thread once dead records
+    outweigh live ones and exceed `compact_min_bytes`, set through
+    `kv_storage_cls_kwargs`. An existing `kv_store_<namespace>.json` is
+    imported on first use.
+    """
+
+    compact_min_bytes: int = 16 * 1024 * 1024
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(working_dir, f"kv_store_{self.namespace}.log")
+        self._legacy_file_name = os.path.join(
+            working_dir, f"kv_store_{self.namespace}.json"
+        )
+        kv_params = self.global_config.get("kv_storage_cls_kwargs", {})
+        self.compact_min_bytes = kv_params.get(
+            "compact_min_bytes", self.compact_min_bytes
+        )
+        # key -> (value offset, value length) in the log
+        self._index: dict[str, tuple[int, int]] = None
+        self._pending: dict[str, Union[dict, None]] = {}
+        self._dropped = False
+        self._live_bytes = 0
+        self._file_size = 0
+        self._reader = None
+        self._lock = asyncio.Lock()
+        self._compaction_task: asyncio.Task = None
+
+    @staticmethod
+    def _encode_record(key: str, value: Union[dict, None]) -> bytes:
+        value_str = "" if value is None else json.dumps(value, ensure_ascii=False)
+        return f"{json.dumps(key)}\t{value_str}\n".encode("utf-8")
+
+    @staticmethod
+    def _scan_log(file_name: str) -> tuple[dict[str, tuple[int, int]], int]:
+        index = {}
+        offset = 0
+        with open(file_name, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # torn write from a crash, drop the partial record
+                    break
+                key_part, _, value_part = line.partition(b"\t")
+                key = json.loads(key_part)
+                value_len = len(value_part) - 1
+                if value_len:
+                    index[key] = (offset + len(key_part) + 1, value_len)
+                else:
+                    index.pop(key, None)
+                offset += len(line)
+        return index, offset
+
+    def _ensure_loaded(self):
+        if self._index is not None:
+            return
+        if not os.path.exists(self._file_name):
+            legacy_data = load_json(self._legacy_file_name) or {}
+            with open(self._file_name, "wb") as f:
+                f.write(
+                    b"".join(self._encode_record(k, v) for k, v in legacy_data.items())
+                )
+            if legacy_data:
+                logger.info(
+                    f"Imported {len(legacy_data)} records from {self._legacy_file_name}"
+                )
+        self._index, self._file_size = self._scan_log(self._file_name)
+        with open(self._file_name, "r+b") as f:
+            f.truncate(self._file_size)
+        self._live_bytes = sum(length for _, length in self._index.values())
+        self._reader = open(self._file_name, "rb")
+        logger.info(f"Load KV {self.namespace} with {len(self._index)} data")
+
+    def _read_value(self, key: str) -> Union[dict, None]:
+        if key in self._pending:
+            return self._pending[key]
+        location = self._index.get(key)
+        if location is None:
+            return None
+        offset, length = location
+        self._reader.seek(offset)
+        return json.loads(self._reader.read(length))
+
+    def _has_key(self, key: str) -> bool:
+        if key in self._pending:
+            return self._pending[key] is not None
+        return key in self._index
+
+    async def all_keys(self) -> list[str]:
+        self._ensure_loaded()
+        keys = set(self._index.keys())
+        for k, v in self._pending.items():
+            if v is None:
+                keys.discard(k)
+            else:
+                keys.add(k)
+        return list(keys)
+
+    async def get_by_id(self, id):
+        self._ensure_loaded()
+        return self._read_value(id)
+
+    async def get_by_ids(self, ids, fields=None):
+        self._ensure_loaded()
+        values = [self._read_value(id) for id in ids]
+        if fields is None:
+            return values
+        return [
+            {k: v for k, v in value.items() if k in fields} if value else None
+            for value in values
+        ]
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        self._ensure_loaded()
+        return set([s for s in data if not self._has_key(s)])
+
+    async def upsert(self, data: dict[str, dict]):
+        self._ensure_loaded()
+        left_data = {k: v for k, v in data.items() if not self._has_key(k)}
+        self._pending.update(left_data)
+        return left_data
+
+    async def delete(self, ids: list[str]):
+        self._ensure_loaded()
+        for id in ids:
+            if self._has_key(id):
+                self._pending[id] = None
+
+    async def drop(self):
+        self._ensure_loaded()
+        # a running compaction would install its index over the dropped one
+        async with self._lock:
+            self._index = {}
+            self._pending = {}
+            self._live_bytes = 0
+            self._dropped = True
+
+    async def index_done_callback(self):
+        if self._index is None:
+            return
+        async with self._lock:
+            if self._dropped:
+                with open(self._file_name, "r+b") as f:
+                    f.truncate(0)
+                self._file_size = 0
+                self._dropped = False
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            records = []
+            offset = self._file_size
+            for key, value in pending.items():
+                record = self._encode_record(key, value)
+                records.append(record)
+                if key in self._index:
+                    self._live_bytes -= self._index.pop(key)[1]
+                if value is not None:
+                    value_len = len(record) - len(json.dumps(key)) - 2
+                    self._index[key] = (offset + len(record) - 1 - value_len, value_len)
+                    self._live_bytes += value_len
+                offset += len(record)
+            with open(self._file_name, "ab") as f:
+                f.write(b"".join(records))
+                f.flush()
+                os.fsync(f.fileno())
+            self._file_size = offset
+        if self._needs_compaction() and (
+            self._compaction_task is None or self._compaction_task.done()
+        ):
+            self._compaction_task = asyncio.ensure_future(self._compact())
+            self._compaction_task.add_done_callback(self._compaction_done)
+
+    def _compaction_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                f"Compacting KV {self.namespace} log failed: {task.exception()!r}"
+            )
+
+    def _needs_compaction(self) -> bool:
+        dead_bytes = self._file_size - self._live_bytes
+        return dead_bytes > self.compact_min_bytes and dead_bytes > self._live_bytes
+
+    def _write_compacted_log(
+        self, index: dict[str, tuple[int, int]]
+    ) -> tuple[str, dict[str, tuple[int, int]], int]:
+        tmp_file_name = self._file_name + ".compact"
+        new_index = {}
+        offset = 0
+        with open(self._file_name, "rb") as src, open(tmp_file_name, "wb") as dst:
+            for key, (value_offset, length) in index.items():
+                src.seek(value_offset)
+                key_part = json.dumps(key).encode("utf-8") + b"\t"
+                dst.write(key_part + src.read(length) + b"\n")
+                new_index[key] = (offset + len(key_part), length)
+                offset += len(key_part) + length + 1
+            dst.flush()
+            os.fsync(dst.fileno())
+        return tmp_file_name, new_index, offset
+
+    async def _compact(self):
+        async with self._lock:
+            before = self._file_size
+            tmp_file_name, new_index, new_size = await asyncio.to_thread(
+                self._write_compacted_log, dict(self._index)
+            )
+            os.replace(tmp_file_name, self._file_name)
+            self._reader.close()
+            self._index, self._file_size = new_index, new_size
+            self._reader = open(self._file_name, "rb")
+            logger.info(
+                f"Compacted KV {self.namespace} log from {before} to {self._file_size} bytes"
+            )
+
+
+@dataclass
+class SqliteKVStorage(BaseKVStorage):
+    """KV storage on a single SQLite file per working dir, in WAL mode.
+
+    Every namespace lives in the same `kv_store` table keyed by
+    (namespace, id). Upserts and deletes are buffered and written in one
+    transaction on `index_done_callback`, i.e. once per insert batch or query.
+    Set `read_only` through `kv_storage_cls_kwargs` to open the file
+    read-only, so several worker processes can serve from one working dir;
+    upserts and deletes are then dropped with a warning.
+    """
+
+    read_only: bool = False
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(working_dir, "kv_store.sqlite")
+        kv_params = self.global_config.get("kv_storage_cls_kwargs", {})
+        self.read_only = kv_params.get("read_only", self.read_only)
+        if self.read_only:
+            self._conn = sqlite3.connect(f"file:{self._file_name}?mode=ro", uri=True)
+        else:
+            self._conn = sqlite3.connect(self._file_name)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv_store ("
+                "namespace TEXT NOT NULL, id TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, id)) WITHOUT ROWID"
+            )
+            self._conn.commit()
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._pending: dict[str, dict] = {}
+        self._deleted: set[str] = set()
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM kv_store WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        logger.info(f"Load KV {self.namespace} with {count} data")
+
+    def _select_by_ids(self, ids: list[str]) -> dict[str, dict]:
+        rows = self._conn.execute(
+            "SELECT id, value FROM kv_store WHERE namespace = ? "
+            "AND id IN (SELECT value FROM json_each(?))",
+            (self.namespace, json.dumps(ids)),
+        )
+        return {id: json.loads(value) for id, value in rows}
+
+    def _select_existing_ids(self, ids: list[str]) -> set[str]:
+        rows = self._conn.execute(
+            "SELECT id FROM kv_store WHERE namespace = ? "
+            "AND id IN (SELECT value FROM json_each(?))",
+            (self.namespace, json.dumps(ids)),
+        )
+        existing = {id for (id,) in rows} - self._deleted
+        return existing | (self._pending.keys() & set(ids))
+
+    async def all_keys(self) -> list[str]:
+        rows = self._conn.execute(
+            "SELECT id FROM kv_store WHERE namespace = ?", (self.namespace,)
+        )
+        keys = {id for (id,) in rows} - self._deleted
+        return list(keys | self._pending.keys())
+
+    async def get_by_id(self, id):
+        return (await self.get_by_ids([id]))[0]
+
+    async def get_by_ids(self, ids, fields=None):
+        found = self._select_by_ids(
+            [id for id in ids if id not in self._pending and id not in self._deleted]
+        )
+        found.update({id: self._pending[id] for id in ids if id in self._pending})
+        values = [found.get(id, None) for id in ids]
+        if fields is None:
+            return values
+        return [
+            {k: v for k, v in value.items() if k in fields} if value else None
+            for value in values
+        ]
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        existing = self._select_existing_ids(data)
+        return set([s for s in data if s not in existing])
+
+    async def upsert(self, data: dict[str, dict]):
+        if self.read_only:
+            # never committed, so buffering them would only grow memory
+            logger.warning(
+                f"KV {self.namespace} is read-only, dropped {len(data)} upserts"
+            )
+            return {}
+        existing = self._select_existing_ids(list(data.keys()))
+        left_data = {k: v for k, v in data.items() if k not in existing}
+        self._pending.update(left_data)
+        return left_data
+
+    async def delete(self, ids: list[str]):
+        if self.read_only:
+            logger.warning(
+                f"KV {self.namespace} is read-only, dropped {len(ids)} deletes"
+            )
+            return
+        for id in ids:
+            self._pending.pop(id, None)
+            self._deleted.add(id)
+
+    async def drop(self):
+        self._pending = {}
+        self._deleted = set()
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM kv_store WHERE namespace = ?", (self.namespace,)
+            )
+
+    async def index_done_callback(self):
+        if not (self._pending or self._deleted):
+            return
+        pending, self._pending = self._pending, {}
+        deleted, self._deleted = self._deleted, set()
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM kv_store WHERE namespace = ? AND id = ?",
+                [(self.namespace, k) for k in deleted],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO kv_store (namespace, id, value) VALUES (?, ?, ?)",
+                [
+                    (self.namespace, k, json.dumps(v, ensure_ascii=False))
+                    for k, v in pending.items()
+                ],
+            )
+
+
+@dataclass
+class BoundedLLMCacheStorage(BaseKVStorage):
+    """Size-bounded LLM response cache on SQLite with compressed entries
+
+    Entries are zlib-compressed JSON in `llm_cache_<namespace>.sqlite` and are
+    read on demand, so boot time and memory do not grow with the cache. Each
+    entry is tagged with the `llm_cache_category` of the call that stored it
+    and expires `ttl` seconds after being written (`category_ttls` overrides
+    it per category, `None` never expires). Once a category exceeds its
+    `category_max_bytes` quota, or the whole cache exceeds `max_bytes`, the
+    least recently ("lru") or least frequently ("lfu") used entries are
+    evicted; sizes are tracked in memory so commits under quota only pay for
+    the TTL delete. All of these are set through
+    `llm_response_cache_storage_cls_kwargs`.
+    """
+
+    eviction_policy: str = "lru"
+    ttl: float = 7 * 24 * 3600
+    max_bytes: int = 256 * 1024 * 1024
+    compression_level: int = 6
+
+    def __post_init__(self):
+        cache_params = self.global_config.get(
+            "llm_response_cache_storage_cls_kwargs", {}
+        )
+        for param in ["eviction_policy", "ttl", "max_bytes", "compression_level"]:
+            setattr(self, param, cache_params.get(param, getattr(self, param)))
+        if self.eviction_policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy {self.eviction_policy}")
+        self.category_ttls: dict[str, float] = cache_params.get("category_ttls", {})
+        self.category_max_bytes: dict[str, int] = cache_params.get(
+            "category_max_bytes", {}
+        )
+
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(
+            working_dir, f"llm_cache_{self.namespace}.sqlite"
+        )
+        self._conn = sqlite3.connect(self._file_name)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "id TEXT PRIMARY KEY, category TEXT NOT NULL, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, expires_at REAL, last_access REAL NOT NULL, "
+            "hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_category ON llm_cache (category)"
+        )
+        self._conn.commit()
+        # access bookkeeping is buffered and written on index_done_callback
+        self._accessed: dict[str, tuple[float, int]] = {}
+        # upper bound of the stored bytes per category: upserts add to it,
+        # deletes do not subtract, and it is recounted after every quota pass
+        self._category_bytes = self._count_category_bytes()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        logger.info(f"Load KV {self.namespace} with {count} data")
+
+    def _count_category_bytes(self) -> dict[str, int]:
+        rows = self._conn.execute(
+            "SELECT category, SUM(size) FROM llm_cache GROUP BY category"
+        )
+        return dict(rows.fetchall())
+
+    def _over_quota_categories(self) -> list[str]:
+        return [
+            category
+            for category, max_bytes in self.category_max_bytes.items()
+            if self._category_bytes.get(category, 0) > max_bytes
+        ]
+
+    def _over_max_bytes(self) -> bool:
+        return sum(self._category_bytes.values()) > self.max_bytes
+
+    def _over_quota(self) -> bool:
+        return self._over_max_bytes() or bool(self._over_quota_categories())
+
+    def _expires_at(self, category: str, now: float) -> Union[float, None]:
+        ttl = self.category_ttls.get(category, self.ttl)
+        return None if ttl is None else now + ttl
+
+    async def all_keys(self) -> list[str]:
+        rows = self._conn.execute(
+            "SELECT id FROM llm_cache WHERE expires_at IS NULL OR expires_at > ?",
+            (time.time(),),
+        )
+        return [id for (id,) in rows]
+
+    async def get_by_id(self, id):
+        return (await self.get_by_ids([id]))[0]
+
+    async def get_by_ids(self, ids, fields=None):
+        now = time.time()
+        rows = self._conn.execute(
+            "SELECT id, value FROM llm_cache WHERE id IN "
+            "(SELECT value FROM json_each(?)) "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (json.dumps(ids), now),
+        )
+        found = {id: json.loads(zlib.decompress(value)) for id, value in rows}
+        for id in found:
+            _, hits = self._accessed.get(id, (now, 0))
+            self._accessed[id] = (now, hits + 1)
+        self.hits += len(found)
+        self.misses += len(ids) - len(found)
+        values = [found.get(id, None) for id in ids]
+        if fields is None:
+            return values
+        return [
+            {k: v for k, v in value.items() if k in fields} if value else None
+            for value in values
+        ]
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        rows = self._conn.execute(
+            "SELECT id FROM llm_cache WHERE id IN (SELECT value FROM json_each(?)) "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (json.dumps(data), time.time()),
+        )
+        existing = {id for (id,) in rows}
+        return set([s for s in data if s not in existing])
+
+    async def upsert(self, data: dict[str, dict]):
+        now = time.time()
+        category = llm_cache_category.get()
+        expires_at = self._expires_at(category, now)
+        rows = []
+        for k, v in data.items():
+            value = zlib.compress(
+                json.dumps(v, ensure_ascii=False).encode("utf-8"),
+                self.compression_level,
+            )
+            size = len(value) + len(k)
+            self._category_bytes[category] = (
+                self._category_bytes.get(category, 0) + size
+            )
+            rows.append((k, category, value, size, expires_at, now))
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO llm_cache "
+                "(id, category, value, size, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        # evict before the commit when a long insert goes over a quota
+        if self._over_quota():
+            self._evict()
+        return data
+
+    async def delete(self, ids: list[str]):
+        for id in ids:
+            self._accessed.pop(id, None)
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(ids),),
+            )
+
+    async def drop(self):
+        self._accessed = {}
+        self._category_bytes = {}
+        with self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def _evict_over(self, max_bytes: int, category: str = None) -> int:
+        # keep the most valuable entries whose running size fits in max_bytes
+        order = (
+            "hits DESC, last_access DESC"
+            if self.eviction_policy == "lfu"
+            else "last_access DESC"
+        )
+        where, params = ("WHERE category = ?", (category,)) if category else ("", ())
+        cursor = self._conn.execute(
+            "DELETE FROM llm_cache WHERE id IN (SELECT id FROM ("
+            f"SELECT id, SUM(size) OVER (ORDER BY {order} ROWS UNBOUNDED PRECEDING) "
+            f"AS kept FROM llm_cache {where}) WHERE kept > ?)",
+            (*params, max_bytes),
+        )
+        return cursor.rowcount
+
+    def _evict(self):
+        now = time.time()
+        accessed, self._accessed = self._accessed, {}
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE llm_cache SET last_access = ?, hits = hits + ? WHERE id = ?",
+                [(at, hits, id) for id, (at, hits) in accessed.items()],
+            )
+            evicted = self._conn.execute(
+                "DELETE FROM llm_cache WHERE expires_at <= ?", (now,)
+            ).rowcount
+            # the quota passes scan a whole category, skip them while under quota
+            if self._over_quota():
+                for category in self._over_quota_categories():
+                    evicted += self._evict_over(
+                        self.category_max_bytes[category], category
+                    )
+                self._category_bytes = self._count_category_bytes()
+                if self._over_max_bytes():
+                    evicted += self._evict_over(self.max_bytes)
+                    self._category_bytes = self._count_category_bytes()
+        if evicted:
+            self.evictions += evicted
+            logger.info(f"Evicted {evicted} entries from {self.namespace}")
+
+    async def index_done_callback(self):
+        self._evict()
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters and per-category entry counts and bytes"""
+        rows = self._conn.execute(
+            "SELECT category, COUNT(*), SUM(size) FROM llm_cache GROUP BY category"
+        )
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "categories": {
+                category: {"entries": count, "bytes": size}
+                for category, count, size in rows
+            },
+        }
+
+
 @dataclass
 class NanoVectorDBStorage(BaseVectorStorage):
     cosine_better_than_threshold: float = 0.2
@@ -115,8 +708,381 @@ class NanoVectorDBStorage(BaseVectorStorage):
         self._client.save()
 
 
+@dataclass
+class MmapVectorDBStorage(BaseVectorStorage):
+    """Vector storage on a memory-mapped float32 matrix.
+
+    Normalized vectors are appended as raw float32 rows to
+    `vdb_<namespace>.f32`, and each row's id and meta fields go to the sidecar
+    `vdb_<namespace>.meta.jsonl`. Nothing is parsed until first use, new
+    vectors never rewrite the matrix, and top-k is a single matmul over the
+    mmap. An existing NanoVectorDB `vdb_<namespace>.json` is imported on first
+    use.
+    """
+
+    cosine_better_than_threshold: float = 0.2
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._matrix_file_name = os.path.join(working_dir, f"vdb_{self.namespace}.f32")
+        self._meta_file_name = os.path.join(
+            working_dir, f"vdb_{self.namespace}.meta.jsonl"
+        )
+        self._legacy_file_name = os.path.join(working_dir, f"vdb_{self.namespace}.json")
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self._dim = self.embedding_func.embedding_dim
+        self.cosine_better_than_threshold = self.global_config.get(
+            "cosine_better_than_threshold", self.cosine_better_than_threshold
+        )
+        self._ids: list[str] = None
+        self._metas: list[dict] = None
+        self._id_to_row: dict[str, int] = None
+        self._matrix: np.ndarray = None
+        self._meta_writer = None
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+    def _import_legacy(self):
+        from nano_vectordb.dbs import load_storage
+
+        storage = load_storage(self._legacy_file_name)
+        with open(self._matrix_file_name, "wb") as f:
+            f.write(self._normalize(storage["matrix"]).tobytes())
+        with open(self._meta_file_name, "w", encoding="utf-8") as f:
+            for row, data in enumerate(storage["data"]):
+                f.write(json.dumps({**data, "__row__": row}, ensure_ascii=False))
+                f.write("\n")
+        logger.info(
+            f"Imported {len(storage['data'])} vectors from {self._legacy_file_name}"
+        )
+
+    def _ensure_loaded(self):
+        if self._ids is not None:
+            return
+        if not os.path.exists(self._matrix_file_name) and os.path.exists(
+            self._legacy_file_name
+        ):
+            self._import_legacy()
+        for file_name in [self._matrix_file_name, self._meta_file_name]:
+            if not os.path.exists(file_name):
+                open(file_name, "wb").close()
+        n_rows = os.path.getsize(self._matrix_file_name) // (self._dim * 4)
+        self._ids, self._metas, self._id_to_row = [], [], {}
+        kept_lines = []
+        with open(self._meta_file_name, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                meta = json.loads(line)
+                row = meta.pop("__row__")
+                if row > len(self._ids) or row >= n_rows:
+                    continue
+                kept_lines.append(line)
+                if row == len(self._ids):
+                    self._ids.append(meta["__id__"])
+                    self._metas.append(meta)
+                else:
+                    old_id = self._ids[row]
+                    if self._id_to_row.get(old_id) == row:
+                        del self._id_to_row[old_id]
+                    self._ids[row] = meta["__id__"]
+                    self._metas[row] = meta
+                self._id_to_row[meta["__id__"]] = row
+        if sum(map(len, kept_lines)) != os.path.getsize(self._meta_file_name):
+            # drop the torn tail and lines for rows the matrix lost, so a later
+            # insert reusing those rows is not shadowed by them on reload
+            self._rewrite_meta(kept_lines)
+        # rows without a committed meta line come from an interrupted upsert
+        with open(self._matrix_file_name, "r+b") as f:
+            f.truncate(len(self._ids) * self._dim * 4)
+        self._meta_writer = open(self._meta_file_name, "a", encoding="utf-8")
+        self._remap()
+        logger.info(f"Load {len(self._ids)} vectors for {self.namespace}")
+
+    def _rewrite_meta(self, lines: list[bytes]):
+        tmp_file_name = self._meta_file_name + ".tmp"
+        with open(tmp_file_name, "wb") as f:
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file_name, self._meta_file_name)
+
+    def _remap(self):
+        if self._matrix is not None and isinstance(self._matrix, np.memmap):
+            self._matrix.flush()
+        if not self._ids:
+            self._matrix = np.zeros((0, self._dim), dtype=np.float32)
+            return
+        self._matrix = np.memmap(
+            self._matrix_file_name,
+            dtype=np.float32,
+            mode="r+",
+            shape=(len(self._ids), self._dim),
+        )
+
+    async def upsert(self, data: dict[str, dict]):
+        logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
+        if not len(data):
+            logger.warning("You insert an empty data to vector DB")
+            return []
+        self._ensure_loaded()
+        contents = [v["content"] for v in data.values()]
+        batches = [
+            contents[i : i + self._max_batch_size]
+            for i in range(0, len(contents), self._max_batch_size)
+        ]
+        embeddings_list = await asyncio.gather(
+            *[self.embedding_func(batch) for batch in batches]
+        )
+        embeddings = self._normalize(np.concatenate(embeddings_list))
+
+        report = {"update": [], "insert": []}
+        new_rows = []
+        meta_lines = []
+        for (k, v), vector in zip(data.items(), embeddings):
+            meta = {
+                "__id__": k,
+                **{k1: v1 for k1, v1 in v.items() if k1 in self.meta_fields},
+            }
+            row = self._id_to_row.get(k)
+            if row is None:
+                row = len(self._ids) + len(new_rows)
+                self._id_to_row[k] = row
+                new_rows.append((k, meta, vector))
+                report["insert"].append(k)
+            else:
+                self._matrix[row] = vector
+                self._metas[row] = meta
+                report["update"].append(k)
+            meta_lines.append(json.dumps({**meta, "__row__": row}, ensure_ascii=False))
+        if new_rows:
+            with open(self._matrix_file_name, "ab") as f:
+                f.write(np.stack([r[2] for r in new_rows]).tobytes())
+                # rows must be durable before any meta line that points at them
+                f.flush()
+                os.fsync(f.fileno())
+            for k, meta, _ in new_rows:
+                self._ids.append(k)
+                self._metas.append(meta)
+            self._remap()
+        self._meta_writer.write("\n".join(meta_lines) + "\n")
+        return report
+
+    async def query(self, query: str, top_k=5):
+        self._ensure_loaded()
+        if not self._ids:
+            return []
+        embedding = await self.embedding_func([query])
+        embedding = self._normalize(embedding[0])
+        scores = self._matrix @ embedding
+        if top_k < len(scores):
+            top_index = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top_index = np.arange(len(scores))
+        top_index = top_index[np.argsort(-scores[top_index])]
+        results = []
+        for row in top_index:
+            score = float(scores[row])
+            if score < self.cosine_better_than_threshold:
+                break
+            results.append(
+                {
+                    **self._metas[row],
+                    "__metrics__": score,
+                    "id": self._ids[row],
+                    "distance": score,
+                }
+            )
+        return results
+
+    async def index_done_callback(self):
+        if self._ids is None:
+            return
+        if isinstance(self._matrix, np.memmap):
+            self._matrix.flush()
+        self._meta_writer.flush()
+        os.fsync(self._meta_writer.fileno())
+
+
+@dataclass
+class HnswVectorDBStorage(BaseVectorStorage):
+    """Approximate nearest-neighbor vector storage on an hnswlib HNSW index.
+
+    Inserts go straight into the graph index, so query latency grows roughly
+    logarithmically with the number of vectors instead of linearly. Recall and
+    latency are tuned through `vector_db_storage_cls_kwargs`: `hnsw_m`,
+    `hnsw_ef_construction` and `hnsw_ef_search`. The index is saved to
+    `vdb_<namespace>.hnsw`. Ids and meta fields go to the append-only sidecar
+    `vdb_<namespace>.hnsw.meta.jsonl`.
+    """
+
+    cosine_better_than_threshold: float = 0.2
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 128
+    hnsw_initial_capacity: int = 10000
+
+    def __post_init__(self):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError(
+                "Please install hnswlib before using HnswVectorDBStorage."
+            ) from None
+
+        working_dir = self.global_config["working_dir"]
+        self._index_file_name = os.path.join(working_dir, f"vdb_{self.namespace}.hnsw")
+        self._meta_file_name = self._index_file_name + ".meta.jsonl"
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self.cosine_better_than_threshold = self.global_config.get(
+            "cosine_better_than_threshold", self.cosine_better_than_threshold
+        )
+        index_params = self.global_config.get("vector_db_storage_cls_kwargs", {})
+        for param in [
+            "hnsw_m",
+            "hnsw_ef_construction",
+            "hnsw_ef_search",
+            "hnsw_initial_capacity",
+        ]:
+            setattr(self, param, index_params.get(param, getattr(self, param)))
+
+        self._ids: list[str] = []
+        self._metas: list[dict] = []
+        if os.path.exists(self._meta_file_name):
+            valid_size = 0
+            with open(self._meta_file_name, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    valid_size += len(line)
+                    meta = json.loads(line)
+                    label = meta.pop("__label__")
+                    if label == len(self._ids):
+                        self._ids.append(meta["__id__"])
+                        self._metas.append(meta)
+                    elif label < len(self._ids):
+                        self._ids[label] = meta["__id__"]
+                        self._metas[label] = meta
+            with open(self._meta_file_name, "r+b") as f:
+                f.truncate(valid_size)
+
+        self._index = hnswlib.Index(
+            space="cosine", dim=self.embedding_func.embedding_dim
+        )
+        if os.path.exists(self._index_file_name):
+            self._index.load_index(self._index_file_name)
+            # labels past the saved index were never committed
+            del self._ids[self._index.get_current_count() :]
+            del self._metas[len(self._ids) :]
+        else:
+            self._ids, self._metas, self._id_to_label = [], [], {}
+            self._index.init_index(
+                max_elements=self.hnsw_initial_capacity,
+                ef_construction=self.hnsw_ef_construction,
+                M=self.hnsw_m,
+            )
+        self._id_to_label = {k: i for i, k in enumerate(self._ids)}
+        self._meta_lines: list[str] = []
+        self._dirty = False
+        logger.info(f"Load {len(self._ids)} vectors for {self.namespace}")
+
+    async def upsert(self, data: dict[str, dict]):
+        logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
+        if not len(data):
+            logger.warning("You insert an empty data to vector DB")
+            return []
+        contents = [v["content"] for v in data.values()]
+        batches = [
+            contents[i : i + self._max_batch_size]
+            for i in range(0, len(contents), self._max_batch_size)
+        ]
+        embeddings_list = await asyncio.gather(
+            *[self.embedding_func(batch) for batch in batches]
+        )
+        embeddings = np.concatenate(embeddings_list).astype(np.float32)
+
+        report = {"update": [], "insert": []}
+        labels = []
+        for k, v in data.items():
+            meta = {
+                "__id__": k,
+                **{k1: v1 for k1, v1 in v.items() if k1 in self.meta_fields},
+            }
+            label = self._id_to_label.get(k)
+            if label is None:
+                label = len(self._ids)
+                self._id_to_label[k] = label
+                self._ids.append(k)
+                self._metas.append(meta)
+                report["insert"].append(k)
+            else:
+                self._metas[label] = meta
+                report["update"].append(k)
+            labels.append(label)
+            self._meta_lines.append(
+                json.dumps({**meta, "__label__": label}, ensure_ascii=False)
+            )
+
+        capacity = self._index.get_max_elements()
+        if len(self._ids) > capacity:
+            self._index.resize_index(max(len(self._ids), capacity * 2))
+        self._index.add_items(embeddings, np.array(labels))
+        self._dirty = True
+        return report
+
+    async def query(self, query: str, top_k=5):
+        if not self._ids:
+            return []
+        embedding = await self.embedding_func([query])
+        top_k = min(top_k, len(self._ids))
+        self._index.set_ef(max(self.hnsw_ef_search, top_k))
+        labels, distances = self._index.knn_query(
+            np.asarray(embedding[0], dtype=np.float32), k=top_k
+        )
+        results = []
+        for label, distance in zip(labels[0], distances[0]):
+            score = 1.0 - float(distance)
+            if score < self.cosine_better_than_threshold:
+                break
+            results.append(
+                {
+                    **self._metas[label],
+                    "__metrics__": score,
+                    "id": self._ids[label],
+                    "distance": score,
+                }
+            )
+        return results
+
+    async def index_done_callback(self):
+        if not self._dirty:
+            return
+        # meta first, labels past the saved index are dropped on load
+        with open(self._meta_file_name, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in self._meta_lines))
+        self._index.save_index(self._index_file_name)
+        self._meta_lines = []
+        self._dirty = False
+
+
 @dataclass
 class NetworkXStorage(BaseGraphStorage):
+    """Graph storage on an in-memory NetworkX graph.
+
+    The graph is persisted as a JSON node/edge snapshot,
+    `graph_<namespace>.snapshot.json`, plus a WAL of upserts,
+    `graph_<namespace>.snapshot.wal`, made of length-prefixed JSON frames that
+    are replayed on load. A commit only appends the new upserts, and the
+    snapshot is rewritten once the WAL outgrows `wal_max_bytes`, set through
+    `graph_storage_cls_kwargs`. GraphML is only written by `export_graphml`.
+    """
+
+    wal_max_bytes: int = 64 * 1024 * 1024
+
     @staticmethod
     def load_nx_graph(file_name) -> nx.Graph:
         if os.path.exists(file_name):
@@ -178,14 +1144,90 @@ class NetworkXStorage(BaseGraphStorage):
         fixed_graph.add_edges_from(edges)
         return fixed_graph
 
+    @staticmethod
+    def load_graph_snapshot(file_name) -> nx.Graph:
+        with open(file_name, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        graph = nx.Graph(**snapshot.get("graph", {}))
+        graph.add_nodes_from(snapshot["nodes"])
+        graph.add_edges_from(snapshot["edges"])
+        return graph
+
+    @staticmethod
+    def write_graph_snapshot(graph: nx.Graph, file_name):
+        logger.info(
+            f"Writing graph snapshot with {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges"
+        )
+        snapshot = {
+            "graph": graph.graph,
+            "nodes": list(graph.nodes(data=True)),
+            "edges": list(graph.edges(data=True)),
+        }
+        tmp_file_name = file_name + ".tmp"
+        with open(tmp_file_name, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file_name, file_name)
+
+    @staticmethod
+    def replay_graph_wal(graph: nx.Graph, file_name) -> int:
+        """Apply the upserts logged in the WAL, return the size of its valid prefix"""
+        valid_size = 0
+        with open(file_name, "rb") as f:
+            while header := f.read(4):
+                if len(header) < 4:
+                    break
+                (length,) = struct.unpack(">I", header)
+                frame = f.read(length)
+                if len(frame) < length:
+                    # torn write from a crash, drop the partial record
+                    break
+                try:
+                    ops = json.loads(frame)
+                except ValueError:
+                    break
+                for op in ops:
+                    if op[0] == "n":
+                        graph.add_node(op[1], **op[2])
+                    else:
+                        graph.add_edge(op[1], op[2], **op[3])
+                valid_size += 4 + length
+        return valid_size
+
     def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
         self._graphml_xml_file = os.path.join(
-            self.global_config["working_dir"], f"graph_{self.namespace}.graphml"
+            working_dir, f"graph_{self.namespace}.graphml"
+        )
+        self._snapshot_file = os.path.join(
+            working_dir, f"graph_{self.namespace}.snapshot.json"
         )
-        preloaded_graph = NetworkXStorage.load_nx_graph(self._graphml_xml_file)
+        self._wal_file = os.path.join(
+            working_dir, f"graph_{self.namespace}.snapshot.wal"
+        )
+        graph_params = self.global_config.get("graph_storage_cls_kwargs", {})
+        self.wal_max_bytes = graph_params.get("wal_max_bytes", self.wal_max_bytes)
+        self._pending_ops = []
+        self._wal_size = 0
+        self._need_snapshot = False
+        if os.path.exists(self._snapshot_file):
+            preloaded_graph = NetworkXStorage.load_graph_snapshot(self._snapshot_file)
+            if os.path.exists(self._wal_file):
+                self._wal_size = NetworkXStorage.replay_graph_wal(
+                    preloaded_graph, self._wal_file
+                )
+                with open(self._wal_file, "r+b") as f:
+                    f.truncate(self._wal_size)
+            source_file = self._snapshot_file
+        else:
+            # graphs written before the snapshot format are migrated on next commit
+            preloaded_graph = NetworkXStorage.load_nx_graph(self._graphml_xml_file)
+            self._need_snapshot = True
+            source_file = self._graphml_xml_file
         if preloaded_graph is not None:
             logger.info(
-                f"Loaded graph from {self._graphml_xml_file} with {preloaded_graph.number_of_nodes()} nodes, {preloaded_graph.number_of_edges()} edges"
+                f"Loaded graph from {source_file} with {preloaded_graph.number_of_nodes()} nodes, {preloaded_graph.number_of_edges()} edges"
             )
         self._graph = preloaded_graph or nx.Graph()
         self._node_embed_algorithms = {
@@ -193,7 +1235,29 @@ class NetworkXStorage(BaseGraphStorage):
         }
 
     async def index_done_callback(self):
-        NetworkXStorage.write_nx_graph(self._graph, self._graphml_xml_file)
+        if self._need_snapshot or (
+            self._pending_ops and self._wal_size > self.wal_max_bytes
+        ):
+            NetworkXStorage.write_graph_snapshot(self._graph, self._snapshot_file)
+            with open(self._wal_file, "wb"):
+                pass
+            self._pending_ops = []
+            self._wal_size = 0
+            self._need_snapshot = False
+            return
+        if not self._pending_ops:
+            return
+        frame = json.dumps(self._pending_ops, ensure_ascii=False).encode("utf-8")
+        with open(self._wal_file, "ab") as f:
+            f.write(struct.pack(">I", len(frame)) + frame)
+            f.flush()
+            os.fsync(f.fileno())
+        self._wal_size += 4 + len(frame)
+        self._pending_ops = []
+
+    async def export_graphml(self, file_name: str = None):
+        """Write the graph as GraphML, by default next to the storage files"""
+        NetworkXStorage.write_nx_graph(self._graph, file_name or self._graphml_xml_file)
 
     async def has_node(self, node_id: str) -> bool:
         return self._graph.has_node(node_id)
@@ -220,13 +1284,33 @@ class NetworkXStorage(BaseGraphStorage):
             return list(self._graph.edges(source_node_id))
         return None
 
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        return [self._graph.nodes.get(n) for n in node_ids]
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        return [self._graph.degree(n) for n in node_ids]
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        return [self._graph.edges.get(e) for e in edges]
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        return [self._graph.degree(s) + self._graph.degree(t) for s, t in edges]
+
+    async def get_nodes_edges(self, node_ids: list[str]):
+        return [
+            list(self._graph.edges(n)) if self._graph.has_node(n) else None
+            for n in node_ids
+        ]
+
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
         self._graph.add_node(node_id, **node_data)
+        self._pending_ops.append(("n", node_id, dict(node_data)))
 
     async def upsert_edge(
         self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]
     ):
         self._graph.add_edge(source_node_id, target_node_id, **edge_data)
+        self._pending_ops.append(("e", source_node_id, target_node_id, dict(edge_data)))
 
     async def embed_nodes(self, algorithm: str) -> tuple[np.ndarray, list[str]]:
         if algorithm not in self._node_embed_algorithms:
@@ -244,3 +1328,195 @@ class NetworkXStorage(BaseGraphStorage):
 
         nodes_ids = [self._graph.nodes[node_id]["id"] for node_id in nodes]
         return embeddings, nodes_ids
+
+
+@dataclass
+class CSRGraphStorage(BaseGraphStorage):
+    """Array-backed graph storage for query serving.
+
+    Built from the graph persisted by `NetworkXStorage` in the same working
+    dir and shares its files. Node ids are interned to ints, adjacency is
+    kept as CSR arrays with a parallel edge-id array, and node/edge
+    attributes are stored column-wise, so degrees are O(1) array reads and
+    edge lookups a binary search. The arrays are built with NumPy and kept
+    as `array.array` for cheap scalar reads.
+
+    Meant for querying an existing graph. Inserts work but are not cheap:
+    the first upsert loads the graph into a `NetworkXStorage` that is kept
+    for later writes, so a writing process holds the graph twice. Reads go
+    to it while it has uncommitted writes, and `index_done_callback`
+    persists it and rebuilds the arrays, i.e. O(graph) per insert batch.
+    """
+
+    def __post_init__(self):
+        self._writer: NetworkXStorage = None
+        self._dirty = False
+        self._build(self._load_graph_storage()._graph)
+
+    def _load_graph_storage(self) -> NetworkXStorage:
+        return NetworkXStorage(
+            namespace=self.namespace, global_config=self.global_config
+        )
+
+    def _writable(self) -> NetworkXStorage:
+        if self._writer is None:
+            self._writer = self._load_graph_storage()
+        self._dirty = True
+        return self._writer
+
+    async def index_done_callback(self):
+        if not self._dirty:
+            return
+        await self._writer.index_done_callback()
+        self._build(self._writer._graph)
+        self._dirty = False
+
+    @staticmethod
+    def _to_columns(records: list[dict]) -> dict[str, Union[list, array]]:
+        keys = dict.fromkeys(k for record in records for k in record)
+        columns = {}
+        for key in keys:
+            values = [record.get(key) for record in records]
+            numbers = [v for v in values if v is not None]
+            if all(type(v) is int for v in values):
+                columns[key] = array("q", values)
+            elif all(type(v) in (int, float) for v in numbers) and any(
+                type(v) is float for v in numbers
+            ):
+                columns[key] = array(
+                    "d", [math.nan if v is None else v for v in values]
+                )
+            else:
+                columns[key] = values
+        return columns
+
+    @staticmethod
+    def _row(columns: dict[str, Union[list, array]], i: int) -> dict:
+        row = {}
+        for key, column in columns.items():
+            value = column[i]
+            if isinstance(column, array):
+                if column.typecode == "q" or not math.isnan(value):
+                    row[key] = value
+            elif value is not None:
+                row[key] = value
+        return row
+
+    def _build(self, graph: nx.Graph):
+        self._node_ids: list[str] = list(graph.nodes())
+        self._node_index = {node_id: i for i, node_id in enumerate(self._node_ids)}
+        self._node_columns = self._to_columns([d for _, d in graph.nodes(data=True)])
+
+        edges = list(graph.edges(data=True))
+        n_nodes, n_edges = len(self._node_ids), len(edges)
+        edge_src = np.array([self._node_index[u] for u, _, _ in edges], dtype=np.int32)
+        edge_tgt = np.array([self._node_index[v] for _, v, _ in edges], dtype=np.int32)
+        self._edge_columns = self._to_columns([d for _, _, d in edges])
+
+        # both directions of every undirected edge, sorted by (row, neighbor)
+        rows = np.concatenate([edge_src, edge_tgt])
+        cols = np.concatenate([edge_tgt, edge_src])
+        edge_ids = np.concatenate([np.arange(n_edges, dtype=np.int32)] * 2)
+        order = np.lexsort((cols, rows))
+        degrees = np.bincount(rows, minlength=n_nodes).astype(np.int64)
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+        self._n_edges = n_edges
+        self._indices = array("i", cols[order].tobytes())
+        self._adj_edge_ids = array("i", edge_ids[order].tobytes())
+        self._degrees = array("q", degrees.tobytes())
+        self._indptr = array("q", indptr.tobytes())
+        logger.info(f"Built CSR graph with {n_nodes} nodes, {n_edges} edges")
+
+    def _find_edge(self, source_node_id: str, target_node_id: str) -> int:
+        u = self._node_index.get(source_node_id)
+        v = self._node_index.get(target_node_id)
+        if u is None or v is None:
+            return -1
+        end = self._indptr[u + 1]
+        pos = bisect_left(self._indices, v, self._indptr[u], end)
+        if pos < end and self._indices[pos] == v:
+            return self._adj_edge_ids[pos]
+        return -1
+
+    async def has_node(self, node_id: str) -> bool:
+        if self._dirty:
+            return await self._writer.has_node(node_id)
+        return node_id in self._node_index
+
+    async def has_edge(self, source_node_id: str, target_node_id: str) -> bool:
+        if self._dirty:
+            return await self._writer.has_edge(source_node_id, target_node_id)
+        return self._find_edge(source_node_id, target_node_id) >= 0
+
+    async def get_node(self, node_id: str) -> Union[dict, None]:
+        if self._dirty:
+            return await self._writer.get_node(node_id)
+        i = self._node_index.get(node_id)
+        if i is None:
+            return None
+        return self._row(self._node_columns, i)
+
+    async def node_degree(self, node_id: str) -> int:
+        if self._dirty:
+            return await self._writer.node_degree(node_id)
+        i = self._node_index.get(node_id)
+        return 0 if i is None else self._degrees[i]
+
+    async def edge_degree(self, src_id: str, tgt_id: str) -> int:
+        return await self.node_degree(src_id) + await self.node_degree(tgt_id)
+
+    async def get_edge(
+        self, source_node_id: str, target_node_id: str
+    ) -> Union[dict, None]:
+        if self._dirty:
+            return await self._writer.get_edge(source_node_id, target_node_id)
+        edge_id = self._find_edge(source_node_id, target_node_id)
+        if edge_id < 0:
+            return None
+        return self._row(self._edge_columns, edge_id)
+
+    async def get_node_edges(self, source_node_id: str):
+        if self._dirty:
+            return await self._writer.get_node_edges(source_node_id)
+        i = self._node_index.get(source_node_id)
+        if i is None:
+            return None
+        neighbors = self._indices[self._indptr[i] : self._indptr[i + 1]]
+        return [(source_node_id, self._node_ids[j]) for j in neighbors]
+
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        if self._dirty:
+            return await self._writer.get_nodes(node_ids)
+        indexes = [self._node_index.get(n) for n in node_ids]
+        return [
+            None if i is None else self._row(self._node_columns, i) for i in indexes
+        ]
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        if self._dirty:
+            return await self._writer.node_degrees(node_ids)
+        indexes = [self._node_index.get(n) for n in node_ids]
+        return [0 if i is None else self._degrees[i] for i in indexes]
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        if self._dirty:
+            return await self._writer.get_edges(edges)
+        edge_ids = [self._find_edge(s, t) for s, t in edges]
+        return [None if e < 0 else self._row(self._edge_columns, e) for e in edge_ids]
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        src_degrees = await self.node_degrees([s for s, _ in edges])
+        tgt_degrees = await self.node_degrees([t for _, t in edges])
+        return [s + t for s, t in zip(src_degrees, tgt_degrees)]
+
+    async def get_nodes_edges(self, node_ids: list[str]):
+        return [await self.get_node_edges(n) for n in node_ids]
+
+    async def upsert_node(self, node_id: str, node_data: dict[str, str]):
+        await self._writable().upsert_node(node_id, node_data)
+
+    async def upsert_edge(
+        self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]
+    ):
+        await self._writable().upsert_edge(source_node_id, target_node_id, edge_data)
@@ -6,8 +6,14 @@ import json
 import logging
 import os
 import re
+import time
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
 from functools import wraps
+from itertools import accumulate
 from hashlib import md5
 from typing import Any, Union, List
 import xml.etree.ElementTree as ET
@@ -15,8 +21,6 @@ import xml.etree.ElementTree as ET
 import numpy as np
 import tiktoken
 
-ENCODER = None
-
 logger = logging.getLogger("lightrag")
 
 
@@ -73,28 +77,375 @@ def compute_mdhash_id(content, prefix: str = ""):
     return prefix + md5(content.encode()).hexdigest()
 
 
+class AsyncCallLimiter:
+    """FIFO concurrency limiter used by `limit_async_func_call`.
+
+    Waiters are parked on futures instead of polling, and a released slot is
+    handed directly to the oldest waiter so calls are served in arrival order.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.in_flight = 0
+        self.total_calls = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        start = time.perf_counter()
+        if self.in_flight < self.max_size and not self._waiters:
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # the slot was already handed over, pass it on
+                    self.release()
+                else:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                raise
+        wait_time = time.perf_counter() - start
+        self.total_calls += 1
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "max_size": self.max_size,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "total_calls": self.total_calls,
+            "total_wait_time": self.total_wait_time,
+            "avg_wait_time": self.total_wait_time / self.total_calls
+            if self.total_calls
+            else 0.0,
+            "max_wait_time": self.max_wait_time,
+        }
+
+
 def limit_async_func_call(max_size: int, waitting_time: float = 0.0001):
-    """Add restriction of maximum async calling times for a async func"""
+    """Add restriction of maximum async calling times for a async func
+
+    `waitting_time` is kept for backward compatibility, waiters no longer poll.
+    The limiter is exposed as `.limiter` on the wrapped function for stats.
+    """
 
     def final_decro(func):
         """Not using async.Semaphore to aovid use nest-asyncio"""
-        __current_size = 0
+        limiter = AsyncCallLimiter(max_size)
 
         @wraps(func)
         async def wait_func(*args, **kwargs):
-            nonlocal __current_size
-            while __current_size >= max_size:
-                await asyncio.sleep(waitting_time)
-            __current_size += 1
-            result = await func(*args, **kwargs)
-            __current_size -= 1
-            return result
+            await limiter.acquire()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                limiter.release()
 
+        wait_func.limiter = limiter
         return wait_func
 
     return final_decro
 
 
+class EmbeddingBatcher:
+    """Coalesce concurrent small embedding calls into shared requests.
+
+    Calls arriving within `max_wait_time` seconds are merged, up to
+    `max_batch_size` texts, into one call of `func` with duplicate texts sent
+    once. The results are split back per caller. Calls that already carry a
+    full batch go straight through.
+    """
+
+    def __init__(self, func, max_batch_size: int, max_wait_time: float):
+        self.func = func
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.total_calls = 0
+        self.total_requests = 0
+        self._pending: list[tuple[list[str], asyncio.Future]] = []
+        self._pending_size = 0
+        self._timer: asyncio.TimerHandle = None
+        # running batches, referenced so the loop cannot collect them early
+        self._tasks: set[asyncio.Task] = set()
+
+    async def __call__(self, texts: list[str]) -> np.ndarray:
+        self.total_calls += 1
+        if len(texts) >= self.max_batch_size:
+            self.total_requests += 1
+            return await self.func(texts)
+        if self._pending_size + len(texts) > self.max_batch_size:
+            self._flush()
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._pending.append((texts, waiter))
+        self._pending_size += len(texts)
+        if self._pending_size >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_time, self._flush)
+        return await waiter
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_size = self._pending, [], 0
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[list[str], asyncio.Future]]):
+        unique_texts = list(dict.fromkeys(t for texts, _ in batch for t in texts))
+        self.total_requests += 1
+        try:
+            embeddings = np.asarray(await self.func(unique_texts))
+            positions = {t: i for i, t in enumerate(unique_texts)}
+            for texts, waiter in batch:
+                if not waiter.done():
+                    waiter.set_result(embeddings[[positions[t] for t in texts]])
+        except BaseException as e:
+            # every caller gets a result, the error or a cancellation
+            for _, waiter in batch:
+                if waiter.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    waiter.cancel()
+                else:
+                    waiter.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+    def stats(self) -> dict:
+        return {
+            "total_calls": self.total_calls,
+            "total_requests": self.total_requests,
+        }
+
+
+def batch_embedding_func_calls(max_batch_size: int, max_wait_time: float = 0.002):
+    """Merge concurrent calls of an embedding func, see `EmbeddingBatcher`
+
+    The batcher is exposed as `.batcher` on the wrapped function for stats.
+    """
+
+    def final_decro(func):
+        batcher = EmbeddingBatcher(func, max_batch_size, max_wait_time)
+
+        @wraps(func)
+        async def batch_func(texts: list[str], **kwargs):
+            if kwargs:
+                return await func(texts, **kwargs)
+            return await batcher(texts)
+
+        batch_func.batcher = batcher
+        return batch_func
+
+    return final_decro
+
+
+class SemanticLLMCache:
+    """Answer LLM calls from earlier calls whose query text means the same
+
+    Entries are partitioned by prompt type. A call carrying
+    `semantic_cache_key=(prompt_type, text)` embeds `text` and returns the
+    cached response of the most similar earlier text of that type if their
+    cosine similarity reaches the type's threshold. Entries expire after
+    `ttl` seconds and each type keeps at most `max_entries`, evicting the
+    least recently used.
+    """
+
+    def __init__(
+        self,
+        embedding_func: EmbeddingFunc,
+        similarity_threshold: float = 0.95,
+        similarity_thresholds: dict[str, float] = None,
+        ttl: float = 24 * 3600,
+        max_entries: int = 1000,
+    ):
+        self.embedding_func = embedding_func
+        self.similarity_threshold = similarity_threshold
+        self.similarity_thresholds = similarity_thresholds or {}
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # prompt_type -> parallel lists of unit vectors, responses, timestamps
+        self._partitions: dict[str, dict[str, list]] = {}
+        self._embeddings: dict[str, np.ndarray] = {}
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+
+    def wrap(self, func):
+        @wraps(func)
+        async def wait_func(*args, semantic_cache_key=None, **kwargs):
+            if semantic_cache_key is None:
+                return await func(*args, **kwargs)
+            prompt_type, text = semantic_cache_key
+            vector = await self._embed(text)
+            cached = self.lookup(prompt_type, vector)
+            if cached is not None:
+                return cached
+            response = await func(*args, **kwargs)
+            self.store(prompt_type, vector, response)
+            return response
+
+        return wait_func
+
+    async def _embed(self, text: str) -> np.ndarray:
+        vector = self._embeddings.get(text)
+        if vector is None:
+            vector = np.asarray((await self.embedding_func([text]))[0], np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+            # the keyword and the response call of one query embed the same text
+            if len(self._embeddings) >= self.max_entries:
+                self._embeddings.pop(next(iter(self._embeddings)))
+            self._embeddings[text] = vector
+        return vector
+
+    def _expire(self, partition: dict[str, list]):
+        deadline = time.time() - self.ttl
+        keep = [i for i, t in enumerate(partition["created"]) if t >= deadline]
+        if len(keep) < len(partition["created"]):
+            for name in partition:
+                partition[name] = [partition[name][i] for i in keep]
+
+    def lookup(self, prompt_type: str, vector: np.ndarray) -> Union[str, None]:
+        partition = self._partitions.get(prompt_type)
+        if partition is not None:
+            self._expire(partition)
+        if partition and partition["vectors"]:
+            scores = np.stack(partition["vectors"]) @ vector
+            best = int(np.argmax(scores))
+            threshold = self.similarity_thresholds.get(
+                prompt_type, self.similarity_threshold
+            )
+            if scores[best] >= threshold:
+                partition["used"][best] = time.time()
+                self.hits[prompt_type] = self.hits.get(prompt_type, 0) + 1
+                return partition["responses"][best]
+        self.misses[prompt_type] = self.misses.get(prompt_type, 0) + 1
+        return None
+
+    def store(self, prompt_type: str, vector: np.ndarray, response: str):
+        partition = self._partitions.setdefault(
+            prompt_type, {"vectors": [], "responses": [], "created": [], "used": []}
+        )
+        if len(partition["vectors"]) >= self.max_entries:
+            lru = min(range(len(partition["used"])), key=partition["used"].__getitem__)
+            for name in partition:
+                del partition[name][lru]
+        now = time.time()
+        partition["vectors"].append(vector)
+        partition["responses"].append(response)
+        partition["created"].append(now)
+        partition["used"].append(now)
+
+    def clear(self):
+        self._partitions.clear()
+
+    def stats(self) -> dict:
+        return {
+            prompt_type: {
+                "hits": self.hits.get(prompt_type, 0),
+                "misses": self.misses.get(prompt_type, 0),
+                "entries": len(
+                    self._partitions.get(prompt_type, {}).get("vectors", [])
+                ),
+            }
+            for prompt_type in set(self.hits) | set(self.misses)
+        }
+
+
+class KeywordsCache:
+    """TTL cache of the keywords extracted from queries, shared by all query modes
+
+    Queries are keyed after case folding and whitespace collapsing, so asking
+    the same question in several modes extracts its keywords once. Entries
+    expire after `ttl` seconds and at most `max_entries` are kept, evicting
+    the least recently used. Concurrent lookups of one query share a single
+    extraction; extractions that return None are not cached.
+    """
+
+    def __init__(self, ttl: float = 600, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.casefold().split())
+
+    async def get_or_compute(self, query: str, compute: callable):
+        key = self.normalize(query)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.hits += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if task.result() is None:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# prompt category of the LLM call in flight, for caches that keep per-category quotas
+llm_cache_category: ContextVar[str] = ContextVar(
+    "llm_cache_category", default="default"
+)
+
+
+@contextmanager
+def use_llm_cache_category(category: str):
+    """Tag the LLM calls made inside the block with a cache category"""
+    token = llm_cache_category.set(category)
+    try:
+        yield
+    finally:
+        llm_cache_category.reset(token)
+
+
 def wrap_embedding_func_with_attrs(**kwargs):
     """Wrap a function with attributes"""
 
@@ -117,19 +468,90 @@ def write_json(json_obj, file_name):
         json.dump(json_obj, f, indent=2, ensure_ascii=False)
 
 
+class TokenizerRegistry:
+    """tiktoken encoders keyed by model or encoding name, with a token-count cache
+
+    `get` accepts a model name ("gpt-4o-mini") or an encoding name
+    ("cl100k_base") and loads each encoder once. Token counts are memoized
+    per (encoding, text) in an LRU bounded to `count_cache_max_chars`
+    characters of cached text, so descriptions that show up in every query
+    context are tokenized once.
+    """
+
+    def __init__(self, count_cache_max_chars: int = 64 * 1024 * 1024):
+        self.count_cache_max_chars = count_cache_max_chars
+        self._encoders: dict[str, tiktoken.Encoding] = {}
+        self._counts: OrderedDict[tuple[str, str], int] = OrderedDict()
+        self._cached_chars = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_or_encoding: str) -> tiktoken.Encoding:
+        encoder = self._encoders.get(model_or_encoding)
+        if encoder is None:
+            try:
+                encoder = tiktoken.encoding_for_model(model_or_encoding)
+            except KeyError:
+                encoder = tiktoken.get_encoding(model_or_encoding)
+            self._encoders[model_or_encoding] = encoder
+        return encoder
+
+    def count_tokens(self, content: str, model_name: str = "gpt-4o") -> int:
+        return self.count_tokens_batch([content], model_name)[0]
+
+    def count_tokens_batch(
+        self, contents: list[str], model_name: str = "gpt-4o"
+    ) -> list[int]:
+        """Token counts of `contents`, encoding the uncached ones in one batch"""
+        encoder = self.get(model_name)
+        counts = [None] * len(contents)
+        missing: dict[str, list[int]] = {}
+        for i, content in enumerate(contents):
+            key = (encoder.name, content)
+            count = self._counts.get(key)
+            if count is None:
+                missing.setdefault(content, []).append(i)
+            else:
+                self._counts.move_to_end(key)
+                counts[i] = count
+        self.hits += len(contents) - sum(len(v) for v in missing.values())
+        self.misses += len(missing)
+        if missing:
+            texts = list(missing)
+            for content, tokens in zip(texts, encoder.encode_batch(texts)):
+                for i in missing[content]:
+                    counts[i] = len(tokens)
+                self._store((encoder.name, content), len(tokens))
+        return counts
+
+    def _store(self, key: tuple[str, str], count: int):
+        if len(key[1]) > self.count_cache_max_chars:
+            return
+        self._counts[key] = count
+        self._cached_chars += len(key[1])
+        while self._cached_chars > self.count_cache_max_chars:
+            (_, evicted), _ = self._counts.popitem(last=False)
+            self._cached_chars -= len(evicted)
+
+    def clear(self):
+        self._counts.clear()
+        self._cached_chars = 0
+
+
+tokenizer_registry = TokenizerRegistry()
+
+
+def get_tiktoken_encoder(model_name: str = "gpt-4o") -> tiktoken.Encoding:
+    return tokenizer_registry.get(model_name)
+
+
 def encode_string_by_tiktoken(content: str, model_name: str = "gpt-4o"):
-    global ENCODER
-    if ENCODER is None:
-        ENCODER = tiktoken.encoding_for_model(model_name)
-    tokens = ENCODER.encode(content)
+    tokens = get_tiktoken_encoder(model_name).encode(content)
     return tokens
 
 
 def decode_tokens_by_tiktoken(tokens: list[int], model_name: str = "gpt-4o"):
-    global ENCODER
-    if ENCODER is None:
-        ENCODER = tiktoken.encoding_for_model(model_name)
-    content = ENCODER.decode(tokens)
+    content = get_tiktoken_encoder(model_name).decode(tokens)
     return content
 
 
@@ -165,15 +587,42 @@ def is_float_regex(value):
     return bool(re.match(r"^[-+]?[0-9]*\.?[0-9]+$", value))
 
 
-def truncate_list_by_token_size(list_data: list, key: callable, max_token_size: int):
-    """Truncate a list of data by token size"""
+def truncate_list_by_token_size(
+    list_data: list,
+    key: callable,
+    max_token_size: int,
+    model_name: str = "gpt-4o",
+    token_count: callable = None,
+    block_size: int = 64,
+):
+    """Truncate a list of data by token size
+
+    With `token_count`, which returns a row's stored token count (or None if
+    it has none), the list is cut with a prefix sum over the stored counts and
+    only rows without one are tokenized. Otherwise rows are counted
+    `block_size` at a time through the tokenizer registry's cache, stopping at
+    the first block that crosses `max_token_size`.
+    """
     if max_token_size <= 0:
         return []
+    if token_count is not None:
+        counts = [token_count(data) for data in list_data]
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            missing_counts = tokenizer_registry.count_tokens_batch(
+                [key(list_data[i]) for i in missing], model_name
+            )
+            for i, count in zip(missing, missing_counts):
+                counts[i] = count
+        return list_data[: bisect_right(list(accumulate(counts)), max_token_size)]
     tokens = 0
-    for i, data in enumerate(list_data):
-        tokens += len(encode_string_by_tiktoken(key(data)))
-        if tokens > max_token_size:
-            return list_data[:i]
+    for start in range(0, len(list_data), block_size):
+        block = [key(data) for data in list_data[start : start + block_size]]
+        counts = tokenizer_registry.count_tokens_batch(block, model_name)
+        for i, count in enumerate(counts, start):
+            tokens += count
+            if tokens > max_token_size:
+                return list_data[:i]
     return list_data
 
 